@@ -0,0 +1,282 @@
+""" Digital Communication - Lempel-Ziv benchmarks """
+
+import gc
+import math
+import os
+import shutil
+import tempfile
+import time
+
+
+WARMUP_ROUNDS = 2
+PERCENTILES = (50, 90, 99)
+
+
+class Timings():
+    """
+    Running times of repeated runs of one operation, with statistics over
+    them.
+
+    Params:
+        times: running time of each run in nanoseconds
+        size: number of bytes of input each run handles, for the throughput
+    """
+
+    def __init__(self, times, size):
+        self.times = sorted(times)
+        self.size = size
+
+
+    def mean(self):
+        """ Mean running time in nanoseconds """
+        return sum(self.times) / len(self.times)
+
+
+    def stddev(self):
+        """ Sample standard deviation of the running times in nanoseconds """
+        if len(self.times) < 2:
+            return 0.0
+
+        mean = self.mean()
+        return math.sqrt(sum((value - mean) ** 2 for value in self.times) / (len(self.times) - 1))
+
+
+    def percentile(self, percent):
+        """
+        Running time below which the given percentage of the runs fall, in
+        nanoseconds, interpolating between the two closest runs.
+        """
+
+        position = (len(self.times) - 1) * percent / 100
+        lower = math.floor(position)
+        upper = min(lower + 1, len(self.times) - 1)
+
+        return self.times[lower] + (self.times[upper] - self.times[lower]) * (position - lower)
+
+
+    def throughput(self):
+        """ Throughput in MB/s at the median running time """
+        median = self.percentile(50)
+        return self.size / median * 1e3 if median else math.inf
+
+
+    def summary(self):
+        """
+        Statistics of the running times, in seconds.
+
+        Returns:
+            Dictionary with the 'min', 'max', 'avg' and 'stddev' of the times,
+            a 'p<N>' entry for each of PERCENTILES, and the throughput as
+            'mb_per_s'.
+        """
+
+        summary = {'min': self.times[0] / 1e9,
+                   'max': self.times[-1] / 1e9,
+                   'avg': self.mean() / 1e9,
+                   'stddev': self.stddev() / 1e9}
+
+        for percent in PERCENTILES:
+            summary[f'p{percent}'] = self.percentile(percent) / 1e9
+
+        summary['mb_per_s'] = self.throughput()
+
+        return summary
+
+
+def measure(function, argument, rounds, warmup=WARMUP_ROUNDS, setup=None):
+    """
+    Time repeated calls of a function with time.perf_counter_ns, after a few
+    untimed warm-up calls. As in timeit, the garbage collector is turned off
+    while timing, so that its pauses do not land in random rounds.
+
+    Params:
+        function: the function to time, called with a single argument
+        argument: the argument to call it with
+        rounds: number of timed calls
+        warmup: number of untimed calls made first
+        setup: function called with no arguments before every call, outside
+               the timing
+
+    Returns:
+        A pair (running times in nanoseconds, result of the last call).
+    """
+
+    result = None
+
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        result = function(argument)
+
+    times = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        for _ in range(rounds):
+            if setup is not None:
+                setup()
+
+            start = time.perf_counter_ns()
+            result = function(argument)
+            times.append(time.perf_counter_ns() - start)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return times, result
+
+
+def benchmark_codec(compress, decompress, data, rounds, warmup=WARMUP_ROUNDS):
+    """
+    Benchmark the in-memory compression and decompression of a message, and
+    check that the message comes back unchanged.
+
+    Params:
+        compress: function from the message to the compressed message
+        decompress: function from the compressed message to the message
+        data: the message
+        rounds: number of timed runs of each function
+        warmup: number of untimed runs of each function made first
+
+    Returns:
+        A triple (encoding timings, decoding timings, compressed size).
+
+    Raises:
+        ValueError: if the decompressed message differs from the original
+    """
+
+    encoding_times, compressed = measure(compress, data, rounds, warmup)
+    decoding_times, decompressed = measure(decompress, compressed, rounds, warmup)
+
+    if decompressed != data:
+        raise ValueError('The decompressed message differs from the original')
+
+    return (Timings(encoding_times, len(data)), Timings(decoding_times, len(data)),
+            len(compressed))
+
+
+def benchmark_file_codec(compress, decompress, filename, rounds, warmup=WARMUP_ROUNDS,
+                         file_ext='.LZ77'):
+    """
+    Benchmark compression and decompression of a file through the file
+    system, for comparison with benchmark_codec to see the cost of the file
+    I/O. Each run works on a fresh copy of the file in a temporary
+    directory, made outside the timing.
+
+    Params:
+        compress: function replacing a file with its compressed file
+        decompress: function replacing a compressed file with the original
+        filename: file to benchmark with, which is left untouched
+        rounds: number of timed runs of each function
+        warmup: number of untimed runs of each function made first
+        file_ext: extension compress adds to the file name
+
+    Returns:
+        A pair (encoding timings, decoding timings).
+
+    Raises:
+        ValueError: if the decompressed file differs from the original
+    """
+
+    with open(filename, 'rb') as input_file:
+        data = input_file.read()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, os.path.basename(filename))
+        compressed_path = path + file_ext
+        saved_path = os.path.join(directory, 'compressed')
+
+        def fresh_copy():
+            if os.path.exists(compressed_path):
+                os.remove(compressed_path)
+            shutil.copyfile(filename, path)
+
+        encoding_times, _ = measure(compress, path, rounds, warmup, fresh_copy)
+        os.replace(compressed_path, saved_path)
+
+        def fresh_compressed():
+            if os.path.exists(path):
+                os.remove(path)
+            shutil.copyfile(saved_path, compressed_path)
+
+        decoding_times, _ = measure(decompress, compressed_path, rounds, warmup, fresh_compressed)
+
+        with open(path, 'rb') as output_file:
+            if output_file.read() != data:
+                raise ValueError('The decompressed file differs from the original')
+
+    return Timings(encoding_times, len(data)), Timings(decoding_times, len(data))
+
+
+def format_timings(name, timings):
+    """ Report of a Timings object as a line of text """
+    summary = timings.summary()
+    percentiles = ', '.join(f'p{percent} = {summary[f"p{percent}"] * 1e3:.3f}'
+                            for percent in PERCENTILES)
+
+    return (f'{name}: mean = {summary["avg"] * 1e3:.3f} ms, '
+            f'stddev = {summary["stddev"] * 1e3:.3f}, min = {summary["min"] * 1e3:.3f}, '
+            f'{percentiles}, max = {summary["max"] * 1e3:.3f}, '
+            f'{summary["mb_per_s"]:.2f} MB/s')
+
+
+def add_arguments(parser):
+    """ Add the benchmark's command line arguments to an argparse parser """
+    parser.add_argument('file')
+    parser.add_argument('window_size', type=int)
+    parser.add_argument('buffer_size', type=int)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=WARMUP_ROUNDS)
+    parser.add_argument('--alg', choices=('lz77', 'gzip', 'bzip2'), default='lz77')
+    parser.add_argument('--file-io', action='store_true',
+                        help='also time compressing and decompressing through files')
+
+
+def run(args):
+    """ Benchmark a codec on a file as the command line arguments say """
+    import bz2
+    import gzip
+
+    from decoder import Lz77Decoder
+    from encoder import Lz77Encoder
+
+    encoder = Lz77Encoder(args.window_size, args.buffer_size)
+    decoder = Lz77Decoder(args.window_size, args.buffer_size)
+
+    if args.alg == 'gzip':
+        codec = (gzip.compress, gzip.decompress)
+    elif args.alg == 'bzip2':
+        codec = (bz2.compress, bz2.decompress)
+    else:
+        codec = (encoder.compress_bytes, decoder.decompress_bytes)
+
+    with open(args.file, 'rb') as bench_file:
+        data = bench_file.read()
+
+    encoding, decoding, compressed_size = benchmark_codec(*codec, data, args.rounds, args.warmup)
+
+    print('-----------------------------------------')
+    print(f'Benchmark ({args.alg})')
+    print('-----------------------------------------')
+    print(f'File:              {args.file}')
+    print(f'Original size:     {len(data)} bytes')
+    print(f'Compressed size:   {compressed_size} bytes')
+    print(f'Rounds:            {args.rounds} (+ {args.warmup} warm-up)')
+    print('-----------------------------------------')
+    print(format_timings('Encoding', encoding))
+    print(format_timings('Decoding', decoding))
+
+    if args.file_io and args.alg == 'lz77':
+        encoding, decoding = benchmark_file_codec(encoder.compress, decoder.decompress,
+                                                  args.file, args.rounds, args.warmup)
+        print(format_timings('Encoding (files)', encoding))
+        print(format_timings('Decoding (files)', decoding))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='LZ77 Benchmark')
+    add_arguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,270 @@
+""" Digital Communication - Lempel-Ziv container format """
+
+import io
+import mmap
+import struct
+import zlib
+
+
+MAGIC = b'LZ77'
+
+# Highest version understood. Version 2 files may hold matches longer than
+# their distance, which overlap the data they produce. Files without them
+# are still written as version 1, for older decoders to read.
+VERSION = 2
+
+# Header flags
+FLAG_BLOCKS = 0x01
+FLAG_INDEX = 0x02
+FLAG_TRAILER = 0x04
+FLAG_LITERALS = 0x08
+FLAG_HUFFMAN = 0x10
+FLAG_STORED = 0x20
+FLAG_DICTIONARY = 0x40
+
+# With FLAG_LITERALS, the bitstream is made of flagged codes rather than
+# triples of a fixed size: a 0 bit followed by a literal byte, or a 1 bit
+# followed by the distance and length of a match.
+
+# With FLAG_HUFFMAN, the codes are the same literals and matches, but they
+# are Huffman coded in blocks, each starting with its own code lengths and
+# ending with an end of block symbol.
+
+# With FLAG_STORED, data that coding would only expand is stored as it is.
+# With FLAG_BLOCKS, this goes for any frame whose bitstream is as large as
+# its block, and the bitstream is then the block itself. Otherwise the
+# whole message follows the header as it is.
+
+# magic, version, flags, distance bits, length bits, window size,
+# buffer size, original size, CRC32 of the original data
+HEADER = struct.Struct('>4sBBBBIIQI')
+
+# With FLAG_BLOCKS, the bitstream is split into frames, each made of the
+# original size of the block and the size of its bitstream, then the
+# bitstream itself padded to a whole byte. The frames end with an empty
+# frame.
+FRAME = struct.Struct('>II')
+
+# With FLAG_INDEX, every block is coded on its own, and the frames are
+# followed by an index holding the file offset of each frame and the
+# original size of its block, then a footer pointing back to the index.
+INDEX_ENTRY = struct.Struct('>QI')
+INDEX_FOOTER = struct.Struct('>QI4s')
+INDEX_MAGIC = b'LZIX'
+
+# With FLAG_TRAILER, the original size and CRC32 in the header are left as
+# zero and follow the frames instead, for streams whose length is not known
+# when the header is written.
+TRAILER = struct.Struct('>QI')
+
+# With FLAG_DICTIONARY, the data was coded following a preset dictionary,
+# and the header is followed by the dictionary's ID, its CRC32.
+DICTIONARY_ID = struct.Struct('>I')
+
+
+class Header():
+    """ Parameters stored at the start of a .LZ77 file """
+
+    def __init__(self, distance_bits, length_bits, window_size, buffer_size,
+                 original_size=0, crc32=0, flags=0, version=VERSION, dictionary_id=0):
+        self.distance_bits = distance_bits
+        self.length_bits = length_bits
+        self.window_size = window_size
+        self.buffer_size = buffer_size
+        self.original_size = original_size
+        self.crc32 = crc32
+        self.flags = flags
+        self.version = version
+        self.dictionary_id = dictionary_id
+
+
+    @property
+    def size(self):
+        """ Size of the packed header in bytes """
+        if self.flags & FLAG_DICTIONARY:
+            return HEADER.size + DICTIONARY_ID.size
+        return HEADER.size
+
+
+    def pack(self):
+        """ Header as bytes """
+        data = HEADER.pack(MAGIC, self.version, self.flags, self.distance_bits,
+                           self.length_bits, self.window_size, self.buffer_size,
+                           self.original_size, self.crc32)
+
+        if self.flags & FLAG_DICTIONARY:
+            data += DICTIONARY_ID.pack(self.dictionary_id)
+
+        return data
+
+
+    @classmethod
+    def unpack(cls, data):
+        """
+        Read a header from the start of the given bytes. The dictionary ID
+        is only read if the data holds all of header.size bytes.
+
+        Returns:
+            The header, or None if the data does not start with one.
+        """
+
+        if len(data) < HEADER.size or not data.startswith(MAGIC):
+            return None
+
+        (_, version, flags, distance_bits, length_bits, window_size,
+         buffer_size, original_size, crc32) = HEADER.unpack_from(data)
+
+        if version > VERSION:
+            raise ValueError(f'Unsupported .LZ77 version: {version}')
+
+        header = cls(distance_bits, length_bits, window_size, buffer_size,
+                     original_size, crc32, flags, version)
+
+        if flags & FLAG_DICTIONARY and len(data) >= header.size:
+            header.dictionary_id, = DICTIONARY_ID.unpack_from(data, HEADER.size)
+
+        return header
+
+
+def read_header(input_file):
+    """
+    Read the header from the start of a compressed file.
+
+    Returns:
+        The header, or None if the file is a bare LZ77 bitstream. In that
+        case the bytes read are not put back.
+
+    Raises:
+        ValueError: if the file ends within the header
+    """
+
+    header = Header.unpack(input_file.read(HEADER.size))
+
+    if header is not None and header.flags & FLAG_DICTIONARY:
+        dictionary_id = input_file.read(DICTIONARY_ID.size)
+        if len(dictionary_id) < DICTIONARY_ID.size:
+            raise ValueError('Compressed data is truncated')
+        header.dictionary_id, = DICTIONARY_ID.unpack(dictionary_id)
+
+    return header
+
+
+def as_buffer(source):
+    """
+    Get the data of an input given as a bytes-like object, so that it can
+    be searched and sliced in place.
+
+    Params:
+        source: a file object, or any object supporting the buffer protocol
+
+    Returns:
+        The source itself if it is bytes, a bytearray or a memory mapped
+        file, a copy as bytes for other buffers (which cannot be searched
+        in place), or None for a file object.
+    """
+
+    if isinstance(source, (bytes, bytearray, mmap.mmap)):
+        return source
+    if hasattr(source, 'read'):
+        return None
+
+    return memoryview(source).cast('B').tobytes()
+
+
+def open_buffer(data):
+    """ File object reading from a buffer returned by as_buffer """
+    if isinstance(data, mmap.mmap):
+        data.seek(0)
+        return data
+    return io.BytesIO(data)
+
+
+class ChecksumReader():
+    """ Wrapper around a file counting the bytes read from it and their CRC32 """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+        self.crc32 = 0
+
+
+    def read(self, size=-1):
+        """ Read from the wrapped file """
+        data = self.stream.read(size)
+        self.size += len(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+        return data
+
+
+def read_frame(input_file):
+    """
+    Read one frame of a compressed file split into blocks.
+
+    Returns:
+        A pair (original block size, bitstream), or None after the last
+        frame.
+    """
+
+    frame = input_file.read(FRAME.size)
+    if len(frame) < FRAME.size:
+        return None
+
+    block_size, bitstream_size = FRAME.unpack(frame)
+    if block_size == 0:
+        return None
+
+    return block_size, input_file.read(bitstream_size)
+
+
+def read_frames(input_file):
+    """ Generator of the frames of a compressed file, see read_frame """
+    while True:
+        frame = read_frame(input_file)
+        if frame is None:
+            break
+        yield frame
+
+
+def write_index(output, entries):
+    """
+    Write the block index at the current position of a compressed file.
+
+    Params:
+        output: file object opened for writing in binary mode
+        entries: list of pairs (frame offset, original block size)
+    """
+
+    index_offset = output.tell()
+
+    for frame_offset, block_size in entries:
+        output.write(INDEX_ENTRY.pack(frame_offset, block_size))
+
+    output.write(INDEX_FOOTER.pack(index_offset, len(entries), INDEX_MAGIC))
+
+
+def read_index(input_file):
+    """
+    Read the block index from the end of a compressed file.
+
+    Returns:
+        List of triples (frame offset, offset of the block in the original
+        data, original block size).
+    """
+
+    input_file.seek(-INDEX_FOOTER.size, 2)
+    index_offset, count, magic = INDEX_FOOTER.unpack(input_file.read(INDEX_FOOTER.size))
+
+    if magic != INDEX_MAGIC:
+        raise ValueError('Block index is missing')
+
+    input_file.seek(index_offset)
+    data = input_file.read(count * INDEX_ENTRY.size)
+
+    entries = []
+    block_start = 0
+
+    for frame_offset, block_size in INDEX_ENTRY.iter_unpack(data):
+        entries.append((frame_offset, block_start, block_size))
+        block_start += block_size
+
+    return entries
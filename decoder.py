@@ -1,21 +1,54 @@
 """ Digital Communication - Lempel-Ziv Decoder """
 
+import io
+import mmap
 import os
+import sys
+import time
+import zlib
+from collections import deque
+from itertools import chain
 from bitarray import bitarray
 
+from container import (FLAG_BLOCKS, FLAG_DICTIONARY, FLAG_HUFFMAN, FLAG_INDEX, FLAG_LITERALS, FLAG_STORED,
+                       FLAG_TRAILER, FRAME, HEADER, INDEX_ENTRY, INDEX_FOOTER, TRAILER, Header,
+                       as_buffer, open_buffer, read_frame, read_frames, read_header,
+                       read_index)
+from huffman import read_codes
+from stats import CodingStats, TimedFile
+
+
+FLUSH_SIZE = 1 << 16
+GROUPS_PER_BLOCK = 1 << 12
+SYMBOLS = [bytes([value]) for value in range(256)]
+
 
 class Lz77Decoder():
     """ LZ77 Decoder """
 
-    def __init__(self, window_size, buffer_size):
+    def __init__(self, window_size=None, buffer_size=None, record_codes=False,
+                 flush_size=FLUSH_SIZE, workers=None, use_mmap=False, dictionary=b'',
+                 collect_stats=False):
         self.window_size = window_size
         self.buffer_size = buffer_size
-        self.distance_bits = window_size.bit_length()
-        self.length_bits = buffer_size.bit_length()
+        self.record_codes = record_codes
+        self.flush_size = flush_size
+        self.workers = workers
+        self.use_mmap = use_mmap
+        self.dictionary = bytes(dictionary)
+        self.history = b''
+        self.code_format = 'fixed'
+        self.stored = False
+        self.indexed = False
+        self.distance_bits = window_size.bit_length() if window_size else 0
+        self.length_bits = buffer_size.bit_length() if buffer_size else 0
         self.step = self.distance_bits + self.length_bits + 8
         self.decompression = []
+        self.collect_stats = collect_stats
+        self.stats = None
         self.file_ext = '.LZ77'
 
+
     def set_window_size(self, window_size):
         """ Setter method for window size """
         self.window_size = window_size
@@ -30,52 +63,516 @@ class Lz77Decoder():
         self.step = self.distance_bits + self.length_bits + 8
 
 
+    def configure(self, header):
+        """ Take the coding parameters from a container header """
+        self.window_size = header.window_size
+        self.buffer_size = header.buffer_size
+        self.distance_bits = header.distance_bits
+        self.length_bits = header.length_bits
+        self.step = self.distance_bits + self.length_bits + 8
+
+        if header.flags & FLAG_HUFFMAN:
+            self.code_format = 'huffman'
+        elif header.flags & FLAG_LITERALS:
+            self.code_format = 'flagged'
+        else:
+            self.code_format = 'fixed'
+
+        self.stored = bool(header.flags & FLAG_STORED)
+        self.indexed = bool(header.flags & FLAG_INDEX)
+
+        if header.flags & FLAG_DICTIONARY:
+            if not self.dictionary:
+                raise ValueError('The compressed data needs a preset dictionary')
+            if zlib.crc32(self.dictionary) != header.dictionary_id:
+                raise ValueError('The preset dictionary does not match the one '
+                                 'the data was coded with')
+
+            # The message was coded following the end of the dictionary
+            self.history = self.dictionary[-self.window_size:]
+        else:
+            self.history = b''
+
+
     def decompress(self, filename):
         """
-        Decompress a file that was compressed using LZ77 coding.
+        Decompress a file that was compressed using LZ77 coding, replacing
+        it with the original file.
+
+        If use_mmap is set, the file is memory mapped and the codes are
+        parsed straight from the mapping; see decode_buffer.
 
         Params:
             filename: name of file to decompress
+
+        Returns:
+            The CodingStats of the run if collect_stats is set, else None.
+        """
+
+        with open(filename, 'rb') as input_file:
+            with open(filename.replace(self.file_ext, ''), 'wb') as output_file:
+                # Empty files cannot be mapped
+                if self.use_mmap and os.fstat(input_file.fileno()).st_size:
+                    with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        stats = self.decompress_stream(mapped, output_file)
+                else:
+                    stats = self.decompress_stream(input_file, output_file)
+
+        os.remove(filename)
+        return stats
+
+
+    def decompress_bytes(self, data):
         """
+        Decompress a message in memory that was compressed using LZ77 coding.
 
+        Params:
+            data: the compressed message, as any object supporting the
+                  buffer protocol
+
+        Returns:
+            The original message.
+        """
+
+        output = io.BytesIO()
+        self.decompress_stream(data, output)
+        return output.getvalue()
+
+
+    def decompress_stream(self, source, output_file):
+        """
+        Decompress a message that was compressed using LZ77 coding, writing
+        the result to a file object.
+
+        If the message starts with a container header, the decoder configures
+        itself from it, stops after the original number of bytes and checks
+        their CRC32. Otherwise it is taken to be a bare bitstream coded with
+        this decoder's window and buffer sizes.
+
+        Only the last window_size bytes of the output are kept in memory, and
+        the rest is written out every flush_size bytes. The codes are only
+        kept in self.decompression if record_codes is set.
+
+        If the message has a block index and workers is set, the blocks are
+        decoded in a pool of that many processes; see write_blocks.
+
+        If collect_stats is set, the time spent decoding the bitstream,
+        reading and writing, and rebuilding the message from the codes is
+        measured, and the codes are counted; see stats.CodingStats.
+        Otherwise none of this costs anything.
+
+        Params:
+            source: file object opened for reading in binary mode, or an
+                    object supporting the buffer protocol, which is parsed
+                    in place
+            output_file: file object opened for writing in binary mode
+
+        Returns:
+            The CodingStats of the run, also kept in self.stats, if
+            collect_stats is set, else None.
+        """
+
+        if not self.collect_stats:
+            self.stats = None
+            self._decompress_stream(source, output_file)
+            return None
+
+        stats = self.stats = CodingStats()
+
+        data = as_buffer(source)
+        if data is None:
+            source = TimedFile(source, stats)
+        else:
+            source = data
+            stats.bytes_read = len(data)
+
+        stats.start()
+        self._decompress_stream(source, TimedFile(output_file, stats))
+        # Copying matches and literals into the message is what is left,
+        # unless the blocks were decoded by worker processes
+        stats.finish('workers' if self.indexed and self.workers else 'copy')
+
+        return stats
+
+
+    def _decompress_stream(self, source, output_file):
         self.decompression = []
+        data = as_buffer(source)
+        input_file = source if data is None else open_buffer(data)
+
+        header = read_header(input_file)
+
+        if header is not None:
+            self.configure(header)
+            original_size = header.original_size
+
+            # The frames give the size of each block, which is enough to
+            # stop decoding at the end
+            if header.flags & FLAG_TRAILER:
+                original_size = None
+        elif self.window_size is None or self.buffer_size is None:
+            raise ValueError('The compressed data has no header, so the window '
+                             'and buffer sizes must be given')
+        else:
+            input_file.seek(0)
+            original_size = None
+
+        if header is not None and header.flags & FLAG_BLOCKS:
+            codes = self.decode_frames(input_file)
+        elif header is not None and header.flags & FLAG_STORED:
+            # The message follows the header as it is
+            codes = ((0, 0, block) for block in iter(lambda: input_file.read(self.flush_size), b''))
+        elif data is not None:
+            codes = self.decode_buffer(data, input_file.tell())
+        else:
+            codes = self.decode_file(input_file)
 
-        message = bytearray(b'')
-        index = 0
+        if self.stats is not None:
+            codes = self.stats.count_codes(codes, 'decode')
 
-        with open(filename, 'rb') as input_file:
-            while True:
-                chunk = bitarray()
+        if header is not None and header.flags & FLAG_INDEX and self.workers:
+            crc32 = self.write_blocks(input_file, output_file)
+        else:
+            crc32 = self.write_message(codes, output_file, original_size,
+                                       self.history if header is not None else b'')
+
+        if header is not None and header.flags & FLAG_TRAILER:
+            trailer = input_file.read(TRAILER.size)
+            if len(trailer) < TRAILER.size:
+                raise ValueError('Compressed data is truncated')
+            _, header.crc32 = TRAILER.unpack(trailer)
+
+        if header is not None and crc32 != header.crc32:
+            raise ValueError('CRC32 mismatch in the decompressed data')
+
+
+    def decode_file(self, input_file):
+        """
+        Read LZ77 codes from a compressed file.
+
+        The file is read in large blocks. "step" bytes always hold exactly 8
+        codes, so each group of 8 codes is turned into a single integer and
+        the fields are taken out of it with shifts and masks.
+
+        Params:
+            input_file: file object opened for reading in binary mode
+
+        Returns:
+            Generator of triples (distance, length, next_sym).
+        """
+
+        block_size = self.step * GROUPS_PER_BLOCK
+
+        if self.code_format != 'fixed':
+            yield from self._decode_variable(iter(lambda: input_file.read(block_size), b''))
+            return
+
+        block = b''
+
+        while True:
+            data = input_file.read(block_size)
+            if not data:
+                break
+
+            block += data
+            whole = len(block) - len(block) % self.step
+
+            yield from self._decode_groups(block, 0, whole)
+
+            block = block[whole:]
+
+        yield from self._decode_tail(block)
+
+
+    def decode_buffer(self, data, start=0):
+        """
+        Read LZ77 codes straight from a bytes-like object, such as a memory
+        mapped file, without copying it into blocks.
+
+        Params:
+            data: the compressed data
+            start: offset of the bitstream in data
+
+        Returns:
+            Generator of triples (distance, length, next_sym).
+        """
+
+        if self.code_format != 'fixed':
+            block_size = self.step * GROUPS_PER_BLOCK
+            yield from self._decode_variable(data[block_start:block_start + block_size]
+                                             for block_start in range(start, len(data), block_size))
+            return
+
+        whole = len(data) - (len(data) - start) % self.step
+
+        yield from self._decode_groups(data, start, whole)
+        yield from self._decode_tail(data[whole:])
+
+
+    def _decode_groups(self, data, start, end):
+        step = self.step
+        code_mask = (1 << step) - 1
+        length_mask = (1 << self.length_bits) - 1
+        distance_shift = self.length_bits + 8
+        shifts = [step * index for index in range(7, -1, -1)]
+
+        for group_start in range(start, end, step):
+            group = int.from_bytes(data[group_start:group_start + step], 'big')
+
+            for shift in shifts:
+                code = group >> shift & code_mask
+                yield (code >> distance_shift,
+                       code >> 8 & length_mask,
+                       SYMBOLS[code & 0xFF])
+
+
+    def _decode_tail(self, data):
+        # Less than 8 codes are left over, the last of which may be missing
+        # its symbol, followed by padding up to a whole byte.
+        chunk = bitarray()
+        chunk.frombytes(bytes(data))
+
+        for c_index in range(0, len(chunk), self.step):
+            code_bin = chunk[c_index:c_index + self.step]
+
+            if len(code_bin) < self.step - 8:
+                break
+
+            yield self._parse_bin_code(code_bin)
+
+
+    def _decode_variable(self, blocks):
+        # Codes of a variable size, read from an iterable of blocks of bytes
+        if self.code_format == 'huffman':
+            return read_codes(blocks)
+        return self._decode_flagged(blocks)
+
+
+    def _decode_flagged(self, blocks):
+        # Flagged codes do not line up with bytes, so they are read from a
+        # bit buffer topped up a few bytes at a time, which keeps the
+        # integers small.
+        length_bits = self.length_bits
+        match_bits = 1 + self.distance_bits + length_bits
+        longest_code = max(match_bits, 9)
+        distance_mask = (1 << self.distance_bits) - 1
+        length_mask = (1 << length_bits) - 1
+        bits = 0
+        bit_count = 0
+
+        for block in blocks:
+            for piece_start in range(0, len(block), 32):
+                piece = block[piece_start:piece_start + 32]
+                bits = (bits & ((1 << bit_count) - 1)) << (len(piece) << 3) | int.from_bytes(piece, 'big')
+                bit_count += len(piece) << 3
+
+                while bit_count >= longest_code:
+                    if bits >> (bit_count - 1) & 1:
+                        bit_count -= match_bits
+                        code = bits >> bit_count
+                        yield (code >> length_bits & distance_mask, code & length_mask, b'')
+                    else:
+                        bit_count -= 9
+                        yield (0, 0, SYMBOLS[bits >> bit_count & 0xFF])
+
+        # The last codes, followed by less than a byte of padding
+        while bit_count:
+            if bits >> (bit_count - 1) & 1:
+                if bit_count < match_bits:
+                    break
+                bit_count -= match_bits
+                code = bits >> bit_count
+                yield (code >> length_bits & distance_mask, code & length_mask, b'')
+            else:
+                if bit_count < 9:
+                    break
+                bit_count -= 9
+                yield (0, 0, SYMBOLS[bits >> bit_count & 0xFF])
 
-                try:
-                    chunk.fromfile(input_file, self.step)
-                except EOFError:
-                    chunk.fromfile(input_file)
 
-                code_len = chunk.length()
+    def decode_frames(self, input_file):
+        """
+        Read LZ77 codes from a compressed file split into frames, as written
+        by Lz77Encoder.write_blocks.
+
+        The blocks were coded with the data before them as history, so
+        together their codes rebuild the message like a single bitstream.
+
+        Params:
+            input_file: file object opened for reading in binary mode, just
+                        after the header
+
+        Returns:
+            Generator of triples (distance, length, next_sym).
+        """
 
-                if code_len == 0:
+        for block_size, bitstream in read_frames(input_file):
+            if self.stored and len(bitstream) == block_size:
+                # A stored block, taken as a single code with a long symbol
+                yield (0, 0, bitstream)
+                continue
+
+            if self.indexed and self.history:
+                # Each block was coded on its own following the dictionary,
+                # not the blocks before it
+                yield (0, 0, decode_block(self, bitstream, block_size))
+                continue
+
+            # Stop at the end of the block, before the padding
+            for code in self.decode_buffer(bitstream):
+                if block_size <= 0:
                     break
 
-                for c_index in range(0, code_len, self.step):
-                    code_bin = chunk[c_index:c_index + self.step]
+                if code[1] + len(code[2]) > block_size:
+                    # The last code may be missing its symbol, which was
+                    # then read from the padding
+                    code = (code[0], min(code[1], block_size), b'')
 
-                    if code_bin.length() < self.step - 8:
-                        break
+                block_size -= code[1] + len(code[2])
+                yield code
 
-                    distance, length, next_sym = self._parse_bin_code(code_bin)
 
-                    self.decompression.append((distance, length, next_sym))
+    def write_blocks(self, input_file, output_file):
+        """
+        Decode a file whose blocks were coded on their own in a pool of
+        worker processes, and write them out in order.
+
+        Params:
+            input_file: file object opened for reading in binary mode, just
+                        after the header
+            output_file: file object opened for writing in binary mode
 
-                    substring = bytes(message[index - distance:index - distance + length]) + next_sym
-                    message += substring
+        Returns:
+            CRC32 of the message.
+        """
 
-                    index += length + 1
+        # Imported here, as loading it takes longer than the rest of the
+        # decoder, which decoding without workers should not pay for
+        from concurrent.futures import ProcessPoolExecutor
 
-        with open(filename.replace(self.file_ext, ''), 'wb') as output_file:
-            output_file.write(bytes(message))
+        pending = deque()
+        crc32 = 0
 
-        os.remove(filename)
+        with ProcessPoolExecutor(self.workers) as pool:
+            for block_size, bitstream in read_frames(input_file):
+                pending.append(pool.submit(decode_block, self, bitstream, block_size))
+
+                if len(pending) > 2 * self.workers:
+                    block = pending.popleft().result()
+                    output_file.write(block)
+                    crc32 = zlib.crc32(block, crc32)
+
+            while pending:
+                block = pending.popleft().result()
+                output_file.write(block)
+                crc32 = zlib.crc32(block, crc32)
+
+        return crc32
+
+
+    def read_range(self, filename, start, length):
+        """
+        Decompress part of a file with a block index, decoding only the
+        blocks that cover it. The compressed file is left in place.
+
+        Params:
+            filename: name of file to read from
+            start: offset of the first byte to read in the original data
+            length: number of bytes to read
+
+        Returns:
+            The bytes read, which are fewer than "length" if the range runs
+            past the end of the original data.
+
+        Raises:
+            ValueError: if "start" or "length" is negative
+        """
+
+        if start < 0 or length < 0:
+            raise ValueError(f'Invalid range: start {start}, length {length}')
+
+        with open(filename, 'rb') as input_file:
+            header = read_header(input_file)
+
+            if header is None or not header.flags & FLAG_INDEX:
+                raise ValueError(f'{filename} has no block index')
+
+            self.configure(header)
+            end = start + length
+            parts = []
+
+            for frame_offset, block_start, block_size in read_index(input_file):
+                if block_start + block_size <= start or block_start >= end:
+                    continue
+
+                input_file.seek(frame_offset)
+                _, bitstream = read_frame(input_file)
+                block = decode_block(self, bitstream, block_size)
+                parts.append(block[max(start - block_start, 0):end - block_start])
+
+        return b''.join(parts)
+
+
+    def write_message(self, codes, output_file, original_size=None, history=b''):
+        """
+        Rebuild a message from its LZ77 codes and write it to a file, keeping
+        only the sliding window of the message in memory.
+
+        Params:
+            codes: iterable of triples (distance, length, next_sym)
+            output_file: file object opened for writing in binary mode
+            original_size: size of the message, if known. Decoding stops once
+                           this many bytes are written, ignoring the padding
+                           at the end of the bitstream.
+            history: data preceding the message, which matches may refer to
+                     but which is not written
+
+        Returns:
+            CRC32 of the message.
+        """
+
+        window_size = self.window_size
+        buffer_size = self.buffer_size
+        flush_len = window_size + self.flush_size
+        message = bytearray(history)
+        # Bytes at the front of message that are history, not output
+        start = len(history)
+        crc32 = 0
+        written = 0
+        remaining = sys.maxsize if original_size is None else original_size
+
+        for distance, length, next_sym in codes:
+            if len(message) - start >= remaining:
+                break
+
+            if self.record_codes:
+                self.decompression.append((distance, length, next_sym))
+
+            if length:
+                check_match(distance, length, window_size, buffer_size)
+                copy_match(message, distance, length)
+
+            message += next_sym
+
+            if len(message) >= flush_len:
+                flushed = len(message) - window_size
+                chunk = message[start:flushed]
+                output_file.write(chunk)
+                crc32 = zlib.crc32(chunk, crc32)
+                written += len(chunk)
+                remaining -= len(chunk)
+                start = max(start - flushed, 0)
+                del message[:flushed]
+
+        chunk = message[start:start + remaining]
+        output_file.write(chunk)
+        crc32 = zlib.crc32(chunk, crc32)
+        written += len(chunk)
+
+        if original_size is not None and written < original_size:
+            raise ValueError('Compressed data is truncated')
+
+        return crc32
 
 
     def _parse_bin_code(self, code_bin):
@@ -88,7 +585,7 @@ class Lz77Decoder():
         distance = self._bitarray_to_int(distance_bin)
         length = self._bitarray_to_int(length_bin)
 
-        if next_sym_bin.length() < 8:
+        if len(next_sym_bin) < 8:
             next_sym = b''
         else:
             next_sym = next_sym_bin.tobytes()
@@ -101,18 +598,338 @@ class Lz77Decoder():
         return int('0b' + bits.to01(), 2)
 
 
-if __name__ == '__main__':
-    import sys
-    import time
+class Lz77Decompressor():
+    """
+    Incremental LZ77 decompressor for data that arrives in chunks, in the
+    manner of zlib.decompressobj.
+
+    It reads data split into frames, as written by Lz77Compressor or by
+    Lz77Encoder with workers set. Only the last window_size bytes of the
+    output and the current frame of input are kept between calls.
+    """
+
+    def __init__(self, dictionary=b''):
+        self.decoder = Lz77Decoder(dictionary=dictionary)
+        self.header = None
+        self.window_size = 0
+        self.input = bytearray()
+        self.codes = None
+        # The rest of a match only partly expanded, and its symbol
+        self.match = None
+        self.frame_left = 0
+        self.frames = 0
+        self.message = bytearray()
+        self.returned = 0
+        self.size = 0
+        self.crc32 = 0
+        self.eof = False
+        self.needs_input = True
+        self.unused_data = b''
+
+
+    def decompress(self, data, max_length=-1):
+        """
+        Decompress a chunk of data.
+
+        Matches are only expanded as far as max_length, the rest of them
+        being kept for later calls, so no more than max_length bytes plus a
+        window of output are held in memory, however the data was crafted.
+
+        Params:
+            data: the chunk, as any object supporting the buffer protocol
+            max_length: if positive, at most this many bytes are returned.
+                        The rest of the output is kept, and returned by
+                        later calls, which may be given b''.
+
+        Returns:
+            Decompressed data, as bytes.
+
+        Raises:
+            ValueError: if the data is corrupt
+        """
+
+        if self.eof:
+            self.unused_data += bytes(data)
+        else:
+            self.input += data
+
+        limit = sys.maxsize if max_length is None or max_length <= 0 else max_length
+        starved = False
+
+        while not self.eof and len(self.message) - self.returned < limit:
+            if self.codes is not None:
+                self._decode_frame(limit)
+            elif not self._read_frame():
+                starved = not self.eof
+                break
+
+        message = self.message
+        end = min(len(message), self.returned + limit)
+        output = bytes(message[self.returned:end])
+        self.returned = end
+
+        # Keep the sliding window and the output not yet returned
+        dropped = min(self.returned, len(message) - self.window_size)
+        if dropped > 0:
+            del message[:dropped]
+            self.returned -= dropped
+
+        self.needs_input = starved and self.returned == len(message)
+
+        return output
+
+
+    def _read_frame(self):
+        # Take the header, the next frame or the end of the stream from the
+        # input, if all of it is there
+        data = self.input
+
+        if self.header is None:
+            if len(data) < HEADER.size:
+                return False
+
+            header = Header.unpack(bytes(data[:HEADER.size]))
+            if header is None or not header.flags & FLAG_BLOCKS:
+                raise ValueError('Lz77Decompressor needs data split into frames')
+
+            if len(data) < header.size:
+                return False
 
-    FILE = sys.argv[1]
-    W = int(sys.argv[2])
-    L = int(sys.argv[3])
+            header = Header.unpack(bytes(data[:header.size]))
+            self.decoder.configure(header)
+            self.header = header
+            self.window_size = header.window_size
+            del data[:header.size]
 
-    decoder = Lz77Decoder(W, L)
+            # Start from the dictionary, which is never returned
+            self.message = bytearray(self.decoder.history)
+            self.returned = len(self.message)
+
+        if len(data) < FRAME.size:
+            return False
+
+        block_size, bitstream_size = FRAME.unpack_from(data)
+
+        if block_size == 0:
+            return self._read_end()
+
+        if len(data) < FRAME.size + bitstream_size:
+            return False
+
+        bitstream = bytes(data[FRAME.size:FRAME.size + bitstream_size])
+        del data[:FRAME.size + bitstream_size]
+
+        if self.decoder.indexed and self.decoder.history:
+            self.codes = iter([(0, 0, decode_block(self.decoder, bitstream, block_size))])
+        elif self.decoder.stored and len(bitstream) == block_size:
+            self.codes = iter([(0, 0, bitstream)])
+        else:
+            self.codes = self.decoder.decode_buffer(bitstream)
+        self.frame_left = block_size
+        self.frames += 1
+
+        return True
+
+
+    def _read_end(self):
+        header = self.header
+        end_size = FRAME.size
+
+        if header.flags & FLAG_INDEX:
+            end_size += self.frames * INDEX_ENTRY.size + INDEX_FOOTER.size
+        if header.flags & FLAG_TRAILER:
+            end_size += TRAILER.size
+
+        if len(self.input) < end_size:
+            return False
+
+        if header.flags & FLAG_TRAILER:
+            header.original_size, header.crc32 = TRAILER.unpack_from(
+                self.input, end_size - TRAILER.size)
+
+        if self.size != header.original_size or self.crc32 != header.crc32:
+            raise ValueError('CRC32 mismatch in the decompressed data')
+
+        self.unused_data = bytes(self.input[end_size:])
+        self.input = bytearray()
+        self.eof = True
+
+        return False
+
+
+    def _decode_frame(self, limit):
+        # Rebuild the current frame's block until it ends or "limit" bytes
+        # are waiting to be returned
+        message = self.message
+        start = len(message)
+        limit += self.returned
+        left = self.frame_left
+        window_size = self.window_size
+        buffer_size = self.header.buffer_size
+        codes = self.codes
+
+        if self.match is not None:
+            codes = chain((self.match,), codes)
+            self.match = None
+
+        for distance, length, next_sym in codes:
+            if length + len(next_sym) > left:
+                # The last code may be missing its symbol, which was then
+                # read from the padding
+                length = min(length, left)
+                next_sym = b''
+
+            if length:
+                check_match(distance, length, window_size, buffer_size)
+
+                room = limit - len(message)
+                if length > room:
+                    # Expand the match no further than the output wanted,
+                    # keeping the rest of it for later calls
+                    copy_match(message, distance, room)
+                    left -= room
+                    self.match = (distance, length - room, next_sym)
+                    break
+
+                copy_match(message, distance, length)
+
+            message += next_sym
+            left -= length + len(next_sym)
+
+            if left <= 0 or len(message) >= limit:
+                break
+        else:
+            raise ValueError('Compressed data is truncated')
+
+        if left <= 0:
+            self.codes = None
+
+        self.frame_left = left
+        self.size += len(message) - start
+        self.crc32 = zlib.crc32(message[start:], self.crc32)
+
+
+def check_match(distance, length, window_size, buffer_size):
+    """
+    Check that a match fits the window and buffer sizes it was coded with,
+    so that corrupt data cannot make a single code produce more output than
+    a lookahead buffer holds.
+
+    Raises:
+        ValueError: if the match is longer or further back than the sizes
+                    allow
+    """
+
+    if length > buffer_size:
+        raise ValueError('Invalid match length')
+    if distance > window_size:
+        raise ValueError('Invalid match distance')
+
+
+def copy_match(message, distance, length):
+    """
+    Append a match to the message being rebuilt.
+
+    A match longer than its distance overlaps the data it produces, so the
+    last "distance" bytes repeat over its whole length. Rather than copying
+    it byte by byte, the repeating part is multiplied, which copies it by
+    doubling.
+
+    Params:
+        message: bytearray holding the message so far
+        distance: how many bytes backwards the match starts
+        length: the length of the match
+
+    Raises:
+        ValueError: if the match starts before the message or the history
+                    kept of it, as only corrupt data can make it do so
+    """
+
+    if not 0 < distance <= len(message):
+        raise ValueError('Invalid match distance')
+
+    start = len(message) - distance
+
+    if length <= distance:
+        message += message[start:start + length]
+    else:
+        repeats, rest = divmod(length, distance)
+        pattern = message[start:]
+        message += pattern * repeats
+        message += pattern[:rest]
+
+
+def decompress_bytes(data, window_size=None, buffer_size=None, **options):
+    """
+    Decompress a message in memory that was compressed using LZ77 coding.
+
+    Params:
+        data: the compressed message, as any object supporting the buffer
+              protocol
+        window_size: size of the sliding window, only needed without a header
+        buffer_size: size of the lookahead buffer, only needed without a header
+        options: further arguments to Lz77Decoder
+
+    Returns:
+        The original message.
+    """
+
+    return Lz77Decoder(window_size, buffer_size, **options).decompress_bytes(data)
+
+
+def decode_block(decoder, bitstream, block_size):
+    """
+    Decode one block that was coded on its own. This runs in a worker
+    process for Lz77Decoder.write_blocks, so it is a module-level function.
+
+    Params:
+        decoder: the decoder whose parameters to use
+        bitstream: the bitstream of the block
+        block_size: original size of the block
+
+    Returns:
+        The decoded block.
+    """
+
+    if decoder.stored and len(bitstream) == block_size:
+        return bitstream
+
+    output = io.BytesIO()
+    decoder.write_message(decoder.decode_buffer(bitstream), output, block_size,
+                          decoder.history)
+    return output.getvalue()
+
+
+def add_arguments(parser):
+    """ Add the decoder's command line arguments to an argparse parser """
+    parser.add_argument('file')
+    # W and L are only needed for bare bitstreams without a header
+    parser.add_argument('window_size', type=int, nargs='?')
+    parser.add_argument('buffer_size', type=int, nargs='?')
+    parser.add_argument('--workers', type=int,
+                        help='decode indexed blocks in this many processes')
+    parser.add_argument('--mmap', action='store_true',
+                        help='memory map the compressed file instead of reading it')
+    parser.add_argument('--dictionary',
+                        help='file holding the preset dictionary the file was coded with')
+    parser.add_argument('--stats', action='store_true',
+                        help='report time per phase, code counts and histograms')
+
+
+def run(args):
+    """ Decompress a file as the command line arguments say, and report on it """
+    FILE = args.file
+
+    dictionary = b''
+    if args.dictionary:
+        with open(args.dictionary, 'rb') as dictionary_file:
+            dictionary = dictionary_file.read()
+
+    decoder = Lz77Decoder(args.window_size, args.buffer_size, workers=args.workers,
+                          use_mmap=args.mmap, dictionary=dictionary, collect_stats=args.stats)
 
     start = time.time()
-    decoder.decompress(FILE)
+    stats = decoder.decompress(FILE)
     end = time.time()
 
     runtime = end - start
@@ -120,9 +937,21 @@ if __name__ == '__main__':
     print('-----------------------------------------')
     print('LZ77 Decoder')
     print('-----------------------------------------')
-    print(f'Sliding window size = {W} bytes')
-    print(f'Lookahead buffer size = {L} bytes')
+    print(f'Sliding window size = {decoder.window_size} bytes')
+    print(f'Lookahead buffer size = {decoder.buffer_size} bytes')
     print('-----------------------------------------')
     print(f'File:              {FILE}')
     print(f'Running time:      {round(runtime, 2)} seconds')
-    print('-----------------------------------------')
\ No newline at end of file
+    print('-----------------------------------------')
+
+    if stats is not None:
+        print(stats.report())
+        print('-----------------------------------------')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='LZ77 Decoder')
+    add_arguments(parser)
+    run(parser.parse_args())
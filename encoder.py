@@ -1,166 +1,1458 @@
 """ Digital Communication - Lempel-Ziv Encoder """
 
+import io
+import math
+import mmap
 import os
-from bitarray import bitarray
+import time
+import zlib
+from collections import Counter, deque
+
+from container import (FLAG_BLOCKS, FLAG_DICTIONARY, FLAG_HUFFMAN, FLAG_INDEX, FLAG_LITERALS,
+                       FLAG_STORED, FLAG_TRAILER, FRAME, HEADER, TRAILER, VERSION, ChecksumReader,
+                       Header, as_buffer, open_buffer, write_index)
+from huffman import HUFFMAN_BLOCK, write_block
+from match_finder import MATCH_FINDERS, MIN_MATCH, make_match_finder
+from sliding_window import SlidingWindow
+from stats import CodingStats, TimedFile
+
+
+SYMBOLS = [bytes([value]) for value in range(256)]
+FLUSH_SIZE = 1 << 16
+BLOCK_SIZE = 1 << 17
+
+PARSERS = ('greedy', 'lazy', 'optimal')
+
+# 'fixed' codes are triples (distance, length, next_sym) of a fixed size,
+# 'flagged' codes are either a literal or a match, told apart by one bit,
+# and 'huffman' codes are the same literals and matches, Huffman coded
+CODE_FORMATS = ('fixed', 'flagged', 'huffman')
+
+# Positions parsed at a time by the lazy and optimal parsers
+PARSE_BLOCK = 1 << 12
+
+# Data whose bytes sampled from it have an entropy above this many bits per
+# byte is taken to be compressed already, and is stored without searching it
+# for matches. Samples are ENTROPY_SAMPLE bytes at most, and smaller inputs
+# than MIN_ENTROPY_SAMPLE are always searched.
+STORED_ENTROPY = 7.9
+ENTROPY_SAMPLE = 1 << 16
+MIN_ENTROPY_SAMPLE = 1 << 12
+
+# Default size of a dictionary made by train_dictionary, and the length of
+# the substrings it counts across the samples
+DICTIONARY_SIZE = 1 << 14
+DICTIONARY_SEGMENT = 8
+
+# Compression levels from fastest to smallest output, as (parser, max_chain,
+# parse_depth)
+LEVELS = {
+    1: ('greedy', 4, None),
+    2: ('greedy', 16, None),
+    3: ('greedy', 64, None),
+    4: ('lazy', 16, None),
+    5: ('lazy', 64, None),
+    6: ('lazy', 256, None),
+    7: ('optimal', 64, 2),
+    8: ('optimal', 256, 8),
+    9: ('optimal', None, None),
+}
+
+# With the fixed code format every code takes as many bits, so the lazy and
+# optimal parsers have no cheaper code to choose and only cost time: the
+# levels past 3 search deeper with the greedy parser instead
+FIXED_LEVELS = {
+    **LEVELS,
+    4: ('greedy', 128, None),
+    5: ('greedy', 256, None),
+    6: ('greedy', 512, None),
+    7: ('greedy', 1024, None),
+    8: ('greedy', 4096, None),
+    9: ('greedy', None, None),
+}
 
 
 class Lz77Encoder():
     """ LZ77 Encoder """
 
-    def __init__(self, window_size, buffer_size):
+    def __init__(self, window_size, buffer_size, match_finder='hash_chain',
+                 max_chain=None, record_codes=False, flush_size=FLUSH_SIZE,
+                 write_header=True, workers=None, block_size=BLOCK_SIZE,
+                 index=False, use_mmap=False, parser='greedy', parse_depth=None,
+                 level=None, code_format='fixed', overlap=False, dictionary=b'',
+                 collect_stats=False):
+        if level is not None:
+            levels = FIXED_LEVELS if code_format == 'fixed' else LEVELS
+            parser, max_chain, parse_depth = levels[level]
+
+        if parser not in PARSERS:
+            raise ValueError(f'Unknown parser: {parser}')
+        if code_format not in CODE_FORMATS:
+            raise ValueError(f'Unknown code format: {code_format}')
+
         self.window_size = window_size
         self.buffer_size = buffer_size
+        self.match_finder = match_finder
+        self.max_chain = max_chain
+        self.parser = parser
+        self.parse_depth = parse_depth
+        self.code_format = code_format
+        self.overlap = overlap
+        self.dictionary = bytes(dictionary)
+        self.record_codes = record_codes
+        self.flush_size = flush_size
+        self.write_header = write_header
+        self.workers = workers
+        self.block_size = block_size
+        self.index = index
+        self.use_mmap = use_mmap
         self.distance_bits = window_size.bit_length()
         self.length_bits = buffer_size.bit_length()
         self.compression = []
+        self.collect_stats = collect_stats
+        self.stats = None
         self.file_ext = '.LZ77'
 
 
     def set_window_size(self, window_size):
         """ Setter method for window size """
         self.window_size = window_size
-        self.distance_bits = (window_size - 1).bit_length()
+        self.distance_bits = window_size.bit_length()
 
 
     def set_buffer_size(self, buffer_size):
         """ Setter method for buffer size """
         self.buffer_size = buffer_size
-        self.length_bits = (buffer_size - 1).bit_length()
+        self.length_bits = buffer_size.bit_length()
 
 
     def compress(self, filename):
         """
-        Compress a file using LZ77 coding.
+        Compress a file using LZ77 coding, replacing it with a .LZ77 file.
+
+        If use_mmap is set, the file is memory mapped and the match finder
+        searches the mapping directly, leaving the buffering to the page
+        cache instead of reading the file a block at a time.
 
         Params:
             filename: name of file to compress
+
+        Returns:
+            The CodingStats of the run if collect_stats is set, else None.
+        """
+
+        with open(filename, 'rb') as input_file:
+            with open(filename + self.file_ext, 'xb') as output:
+                # Empty files cannot be mapped
+                if self.use_mmap and os.fstat(input_file.fileno()).st_size:
+                    with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        stats = self.compress_stream(mapped, output)
+                else:
+                    stats = self.compress_stream(input_file, output)
+
+        os.remove(filename)
+        return stats
+
+
+    def compress_bytes(self, data):
+        """
+        Compress a message in memory using LZ77 coding.
+
+        Params:
+            data: the message, as any object supporting the buffer protocol
+
+        Returns:
+            The compressed message, in the same format as compress writes.
+        """
+
+        output = io.BytesIO()
+        self.compress_stream(data, output)
+        return output.getvalue()
+
+
+    def compress_stream(self, source, output):
+        """
+        Compress a message using LZ77 coding, writing the result to a file
+        object.
+
+        The output is written every flush_size bytes, so memory use does not
+        grow with the size of a file read from. The codes are only kept in
+        self.compression if record_codes is set, which cannot be done with
+        more than one worker.
+
+        Unless write_header is unset, the bitstream is preceded by a header
+        holding the coding parameters, the original size and its CRC32. When
+        reading from a file object, the last two are only known at the end,
+        so the output must be seekable for the header to be written again.
+
+        If workers is set, the message is instead split into blocks of
+        block_size bytes that are coded by a pool of that many processes;
+        see write_blocks.
+
+        If a preset dictionary is given, the sliding window starts out
+        holding its last window_size bytes, so that matches can be found
+        from the first byte. The decoder needs the same dictionary, whose
+        ID is written after the header.
+
+        With a header, data that looks compressed already is stored as it
+        is without being searched, and so is data whose bitstream turns out
+        larger than itself. A message in memory is coded into a buffer
+        first to tell; one read from a file is read again, so this is only
+        done if both files are seekable. The output is then never more than
+        a header larger than the message.
+
+        If collect_stats is set, the time spent searching for matches,
+        maintaining the sliding window, reading and writing, and packing the
+        codes is measured, and the codes are counted; see stats.CodingStats.
+        Otherwise none of this costs anything.
+
+        Params:
+            source: file object opened for reading in binary mode, or an
+                    object supporting the buffer protocol, which is searched
+                    in place
+            output: file object opened for writing in binary mode
+
+        Returns:
+            The CodingStats of the run, also kept in self.stats, if
+            collect_stats is set, else None.
+        """
+
+        if not self.collect_stats:
+            self.stats = None
+            self._compress_stream(source, output)
+            return None
+
+        stats = self.stats = CodingStats()
+
+        data = as_buffer(source)
+        if data is None:
+            source = TimedFile(source, stats)
+        else:
+            source = data
+            stats.bytes_read = len(data)
+
+        stats.start()
+        self._compress_stream(source, TimedFile(output, stats))
+        # Packing the codes into bits is what is left, unless the blocks
+        # were coded by worker processes
+        stats.finish('pack' if self.workers is None else 'workers')
+
+        return stats
+
+
+    def _compress_stream(self, source, output):
+        if self.workers is not None and not self.write_header:
+            raise ValueError('Coding in blocks needs the container header')
+        if self.workers is not None and self.workers > 1 and self.record_codes:
+            raise ValueError('Codes made in worker processes cannot be recorded')
+
+        self.compression = []
+        data = as_buffer(source)
+        store = self.write_header and self.workers is None
+
+        # Only a seekable file can be read again to store it, and its header
+        # can only be written once the output is seekable too
+        if data is None and store and source.seekable() and output.seekable():
+            source_start = source.tell()
+            sample = source.read(ENTROPY_SAMPLE)
+            source.seek(source_start)
+        elif data is None:
+            store = False
+        else:
+            sample = data
+
+        if store and looks_incompressible(sample):
+            if data is None:
+                self.write_stored(source, output)
+            else:
+                self.write_stored(open_buffer(data), output, len(data), zlib.crc32(data))
+            return
+
+        if data is not None:
+            crc32 = zlib.crc32(data) if self.write_header else 0
+
+        if data is not None and self.workers is None:
+            codes = self.encode(data, self.preset_history())
+            if self.stats is not None:
+                codes = self.stats.count_codes(codes, 'search')
+
+            if not store:
+                if self.write_header:
+                    output.write(self.make_header(len(data), crc32).pack())
+                self.write_codes(codes, output)
+                return
+
+            # The bitstream is kept until it is known not to be larger than
+            # the message, as the output need not be seekable
+            bitstream = io.BytesIO()
+            self.write_codes(codes, bitstream)
+
+            if bitstream.tell() > len(data):
+                self.write_stored(open_buffer(data), output, len(data), crc32)
+            else:
+                output.write(self.make_header(len(data), crc32).pack())
+                output.write(bitstream.getbuffer())
+            return
+
+        reader = ChecksumReader(source if data is None else open_buffer(data))
+
+        if self.write_header and data is None:
+            # Written again once the size and CRC32 are known
+            header_start = output.tell()
+            output.write(self.make_header().pack())
+        elif self.write_header:
+            output.write(self.make_header(len(data), crc32).pack())
+
+        if self.workers is None:
+            codes = self.encode_file(reader)
+            if self.stats is not None:
+                codes = self.stats.count_codes(codes, 'search')
+
+            self.write_codes(codes, output)
+        else:
+            self.write_blocks(reader, output)
+
+        if self.write_header and data is None:
+            end = output.tell()
+            output.seek(header_start)
+            output.write(self.make_header(reader.size, reader.crc32).pack())
+            output.seek(end)
+
+            if store and end - header_start - HEADER.size > reader.size:
+                source.seek(source_start)
+                output.seek(header_start)
+                output.truncate()
+                self.write_stored(source, output)
+
+
+    def write_stored(self, input_file, output, original_size=None, crc32=None):
+        """
+        Write a message as it is after a header flagged FLAG_STORED, for data
+        that LZ77 coding would only expand.
+
+        Params:
+            input_file: file object opened for reading in binary mode
+            output: file object opened for writing in binary mode. Unless
+                    the size and CRC32 of the message are given, it must be
+                    seekable, for the header to be written again once they
+                    are known.
+            original_size: size of the message, if known
+            crc32: CRC32 of the message, if known
         """
 
         self.compression = []
+        reader = ChecksumReader(input_file)
+        header = self.make_header(original_size or 0, crc32 or 0)
+        header.flags |= FLAG_STORED
+        # Stored data does not refer to the dictionary
+        header.flags &= ~FLAG_DICTIONARY
 
-        with open(filename + self.file_ext, 'x') as output:
-            pass
+        if original_size is None:
+            header_start = output.tell()
+        output.write(header.pack())
 
-        code_to_write = bitarray()
+        for block in iter(lambda: reader.read(self.flush_size), b''):
+            output.write(block)
 
-        with open(filename, 'rb') as input_file:
-            buffer = bitarray()
-            window = bitarray()
+        if original_size is None:
+            header.original_size = reader.size
+            header.crc32 = reader.crc32
+
+            end = output.tell()
+            output.seek(header_start)
+            output.write(header.pack())
+            output.seek(end)
 
-            try:
-                buffer.fromfile(input_file, self.buffer_size)
-            except EOFError:
-                buffer.fromfile(input_file)
 
-            while buffer.length() > 0:
-                code = bitarray()
+    def make_header(self, original_size=0, crc32=0):
+        """
+        Create the container header describing this encoder's output.
 
-                distance, length, next_sym = self.encode_at_pos(window, buffer)
-                code = self.code_to_bits(distance, length, next_sym)
-                code_to_write += code
+        Params:
+            original_size: size of the uncompressed data in bytes
+            crc32: CRC32 of the uncompressed data
+        """
 
-                self.compression.append((distance, length, next_sym))
+        flags = 0
 
-                next_bytes = bitarray()
-                try:
-                    next_bytes.fromfile(input_file, length + 1)
-                except EOFError:
-                    pass
+        if self.code_format == 'flagged':
+            flags |= FLAG_LITERALS
+        elif self.code_format == 'huffman':
+            flags |= FLAG_HUFFMAN
 
-                window += buffer[:(length + 1) * 8]
+        if self.workers is not None:
+            flags |= FLAG_BLOCKS | FLAG_STORED
+            if self.index:
+                flags |= FLAG_INDEX
 
-                if window.length() > self.window_size * 8:
-                    del window[:window.length() - self.window_size * 8]
+        if self.dictionary:
+            flags |= FLAG_DICTIONARY
 
-                del buffer[:(length + 1) * 8]
-                buffer += next_bytes
+        # Only files that may hold overlapping matches need a newer decoder
+        version = VERSION if self.overlap else 1
 
-        with open(filename + self.file_ext, 'ab') as output:
-            output.write(code_to_write.tobytes())
+        return Header(self.distance_bits, self.length_bits, self.window_size,
+                      self.buffer_size, original_size, crc32, flags, version,
+                      zlib.crc32(self.dictionary))
 
-        os.remove(filename)
 
+    def preset_history(self):
+        """ Part of the preset dictionary that the sliding window starts with """
+        return self.dictionary[-self.window_size:] if self.dictionary else b''
 
-    def code_to_bits(self, distance, length, next_sym):
+
+    def encode(self, data, history=b''):
         """
-        Encode a distance-length pair and the next character from the
-        LZ77 algorithm as binary.
+        Perform LZ77 coding on a whole message, using the configured match
+        finder over the sliding window.
+
+        The 'hash_chain' finder takes the longest match closest to each
+        position, as long as max_chain is None. A maximum chain depth
+        makes the search give up early on long chains, which may give shorter
+        matches. The 'binary_tree' finder places every position in a tree,
+        which costs more per byte than a hash chain, but its search does not
+        grow with the chains, so it is faster with large windows over data
+        with many short repeats, such as images. Without max_chain its
+        matches are as long as the 'hash_chain' finder's but for rare cases
+        where they run into the lookahead buffer, though not always the
+        closest ones, so the codes may differ.
+
+        If overlap is set, matches may run on into the lookahead buffer, so
+        that a run of repeated data is coded as a single long match, the
+        first period of which has been coded before it.
 
         Params:
-            distance: how many bytes backwards the match was found
-            length: the length of the found match
-            next_sym: the character following the matched substring
+            data: the message to encode, as bytes or a memory mapped file
+            history: data preceding the message, which matches may refer to
+                     but which is not coded itself
 
         Returns:
-            Bitarray encoding the LZ77 code.
+            Generator of triples (distance, length, next_sym).
+        """
+
+        if history:
+            data = bytes(history) + bytes(data)
+
+        window = SlidingWindow(self.window_size, self.lookahead_size(), data=data)
+        window.pos = len(history)
+
+        return self._encode_window(window)
+
+
+    def compressed_size(self, data, match_index):
+        """
+        Size of what compress_bytes would write for a message, worked out
+        from a MatchIndex of it instead of searching the window: the greedy
+        parse is replayed with the longest matches looked up in the index.
+        As fixed size codes only depend on the lengths of the matches, this
+        gives the exact size at a fraction of the cost.
+
+        Params:
+            data: the message
+            match_index: MatchIndex of the message, with a max_window and
+                         max_length at least as large as this encoder's
+
+        Returns:
+            The compressed size in bytes, header included.
+
+        Raises:
+            ValueError: if the encoder's options make its codes depend on
+                        more than the longest matches, or the index is too
+                        small for it
+        """
+
+        if (self.parser != 'greedy' or self.max_chain is not None or self.code_format != 'fixed'
+                or self.overlap or self.dictionary or self.workers is not None):
+            raise ValueError('Sizes can only be worked out for greedy fixed size codes')
+        if (match_index.max_window < self.window_size
+                or match_index.max_length < max(min(self.buffer_size, len(data)) - 1, 1)):
+            raise ValueError('The match index is too small for the encoder')
+
+        data_len = len(data)
+        header_size = HEADER.size if self.write_header else 0
+
+        if self.write_header and looks_incompressible(data):
+            return header_size + data_len
+
+        step = self.distance_bits + self.length_bits + 8
+        bit_count = 0
+        pos = 0
+
+        while pos < data_len:
+            # As in _encode_greedy, with all of the message at hand
+            max_length = max(min(self.buffer_size, data_len - pos) - 1, 1)
+            length = min(match_index.longest(pos, self.window_size), max_length)
+
+            bit_count += step
+            if pos + length >= data_len:
+                bit_count -= 8
+
+            pos += length + 1
+
+        size = (bit_count + 7) // 8
+
+        if self.write_header and size > data_len:
+            return header_size + data_len
+
+        return header_size + size
+
+
+    def encode_file(self, input_file):
+        """
+        Perform LZ77 coding on the contents of a file, reading it a block at
+        a time so that only the sliding window and lookahead buffer are held
+        in memory.
+
+        Params:
+            input_file: file object opened for reading in binary mode
+
+        Returns:
+            Generator of triples (distance, length, next_sym).
+        """
+
+        history = self.preset_history()
+        window = SlidingWindow(self.window_size, self.lookahead_size(),
+                               stream=input_file, data=history)
+        window.pos = len(history)
+
+        return self._encode_window(window)
+
+
+    def lookahead_size(self):
+        """
+        Number of bytes past the current position that the encoder needs to
+        see before coding it.
+        """
+
+        if self.parser == 'greedy':
+            return self.buffer_size + MIN_MATCH
+        return PARSE_BLOCK + self.buffer_size + MIN_MATCH
+
+
+    def _encode_window(self, window):
+        match_finder = make_match_finder(self.match_finder, self.window_size,
+                                         self.buffer_size, self.max_chain, self.overlap)
+        match_finder.insert_range(window.data, 0, window.pos, window.eof)
+
+        if self.stats is not None:
+            window.fill = self.stats.timed('window', window.fill)
+
+        if self.parser != 'greedy':
+            return self._encode_parsed(window, match_finder)
+
+        return self._encode_greedy(window, match_finder)
+
+
+    def _encode_greedy(self, window, match_finder):
+        # Take the longest match at each position. With codes of a fixed
+        # size this already gives the fewest codes, as long as every search
+        # finds the longest match.
+        flagged = self.code_format != 'fixed'
+        min_match = self.min_match_length()
+
+        while True:
+            if window.needs_fill():
+                match_finder.slide(window.fill())
+
+                if window.needs_fill():
+                    # A fed window is waiting for more input
+                    yield None
+                    continue
+
+            data = window.data
+            data_len = len(data)
+            pos = window.pos
+
+            if pos >= data_len:
+                if window.eof:
+                    break
+                yield None
+                continue
+
+            buffer_len = min(self.buffer_size, data_len - pos)
+
+            if flagged:
+                # Matches are coded without a symbol, and short ones as
+                # literals
+                distance, length = match_finder.find(data, pos, buffer_len)
+
+                if length >= min_match:
+                    yield (distance, length, b'')
+                else:
+                    length = 1
+                    yield (0, 0, SYMBOLS[data[pos]])
+
+                match_finder.insert_range(data, pos, pos + length, window.eof)
+                window.pos = pos + length
+                continue
+
+            if buffer_len > 1:
+                max_length = buffer_len - 1
+            elif data_len - pos > 1 or window.eof:
+                max_length = 1
+            else:
+                # Only the very last code may go without a symbol
+                max_length = 0
+
+            distance, length = match_finder.find(data, pos, max_length)
+
+            if pos + length < data_len:
+                next_sym = SYMBOLS[data[pos + length]]
+            else:
+                next_sym = b''
+
+            yield (distance, length, next_sym)
+
+            match_finder.insert_range(data, pos, pos + length + 1, window.eof)
+            window.pos = pos + length + 1
+
+
+    def _encode_parsed(self, window, match_finder):
+        # Find the longest match at every position of a block, then let the
+        # parser choose which of them to code. The last code of a block may
+        # run past its end, and the positions it covers are only inserted
+        # into the match finder at the start of the next block.
+        inserted = window.pos
+        costs = [self.code_cost(length) for length in range(self.buffer_size + 1)]
+        flagged = self.code_format != 'fixed'
+
+        while True:
+            if window.needs_fill():
+                dropped = window.fill()
+                match_finder.slide(dropped)
+                inserted -= dropped
+
+                if window.needs_fill():
+                    yield None
+                    continue
+
+            data = window.data
+            data_len = len(data)
+            pos = window.pos
+            eof = window.eof
+
+            if pos >= data_len:
+                if eof:
+                    break
+                yield None
+                continue
+
+            match_finder.insert_range(data, inserted, pos, eof)
+
+            end = min(pos + PARSE_BLOCK, data_len)
+            distances = []
+            lengths = []
+
+            for match_pos in range(pos, end):
+                buffer_len = min(self.buffer_size, data_len - match_pos)
+
+                if flagged:
+                    max_length = buffer_len
+                elif buffer_len > 1:
+                    max_length = buffer_len - 1
+                elif data_len - match_pos > 1 or eof:
+                    max_length = 1
+                else:
+                    max_length = 0
+
+                distance, length = match_finder.find(data, match_pos, max_length)
+                distances.append(distance)
+                lengths.append(length)
+                match_finder.insert_range(data, match_pos, match_pos + 1, eof)
+
+            inserted = end
+
+            if self.parser == 'lazy':
+                choices = parse_lazy(lengths, costs, not flagged)
+            else:
+                choices = parse_optimal(lengths, costs, self.parse_depth, not flagged)
+
+            for offset, length in choices:
+                code_pos = pos + offset
+
+                if flagged:
+                    if length:
+                        yield (distances[offset], length, b'')
+                    else:
+                        length = 1
+                        yield (0, 0, SYMBOLS[data[code_pos]])
+
+                    window.pos = code_pos + length
+                    continue
+
+                if code_pos + length < data_len:
+                    next_sym = SYMBOLS[data[code_pos + length]]
+                else:
+                    next_sym = b''
+
+                yield (distances[offset] if length else 0, length, next_sym)
+
+                window.pos = code_pos + length + 1
+
+
+    def code_cost(self, length):
+        """
+        Size in bits of a code for a match of the given length, or for a
+        literal if the length is 0. Huffman codes are only known once a
+        block is coded, so they are taken to cost as much as flagged codes.
+        """
+
+        if self.code_format != 'fixed':
+            return 9 if length == 0 else 1 + self.distance_bits + self.length_bits
+        return self.distance_bits + self.length_bits + 8
+
+
+    def min_match_length(self):
+        """
+        Shortest match worth coding as a match rather than as literals, with
+        flagged or Huffman codes.
+        """
+
+        return self.code_cost(1) // self.code_cost(0) + 1
+
+
+    def write_codes(self, codes, output):
+        """
+        Write LZ77 codes to a file as a bitstream in the configured code
+        format, flushing the bytes packed so far every flush_size bytes;
+        see CodePacker.
+
+        Params:
+            codes: iterable of triples (distance, length, next_sym)
+            output: file object opened for writing in binary mode
+        """
+
+        packer = CodePacker(self.distance_bits, self.length_bits, self.code_format,
+                            self.compression if self.record_codes else None)
+        codes = iter(codes)
+
+        while packer.pack(codes, self.flush_size):
+            output.write(packer.take())
+
+        output.write(packer.finish())
+
+
+    def write_blocks(self, input_file, output):
+        """
+        Code a file as blocks of block_size bytes, spread over a pool of
+        worker processes, and write them as frames.
+
+        Each block is primed with the window_size bytes before it, so that
+        matches can still reach back across the block boundary. Blocks that
+        do not compress are stored as they are; see encode_block. If index is
+        set, blocks are instead coded on their own and an index of the
+        frames is written after them, so that blocks can later be decoded
+        in parallel or one at a time.
+
+        Only a few blocks per worker are in flight at a time, and the frames
+        are written in order as they complete.
+
+        Params:
+            input_file: file object opened for reading in binary mode
+            output: file object opened for writing in binary mode
         """
 
-        distance_bin = bin(distance)[2:].rjust(self.distance_bits, '0')
-        length_bin = bin(length)[2:].rjust(self.length_bits, '0')
+        # Imported here, as loading it takes longer than the rest of the
+        # encoder, which coding without workers should not pay for
+        from concurrent.futures import ProcessPoolExecutor
+
+        pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        # Workers are sent an encoder with only the coding parameters, not
+        # the state of this one
+        block_encoder = self.block_encoder()
+        pending = deque()
+        entries = []
+        # Blocks coded on their own still start from the preset dictionary
+        history = self.preset_history()
+
+        try:
+            while True:
+                block = input_file.read(self.block_size)
+                if not block:
+                    break
 
-        next_sym_bin = bitarray()
-        next_sym_bin.frombytes(next_sym)
+                if pool is None:
+                    self._write_frame(output, len(block),
+                                      encode_block(self, history, block), entries)
+                else:
+                    pending.append((len(block),
+                                    pool.submit(encode_block, block_encoder, history, block)))
 
-        code = bitarray(distance_bin + length_bin) + next_sym_bin
+                    if len(pending) > 2 * self.workers:
+                        size, future = pending.popleft()
+                        self._write_frame(output, size, future.result(), entries)
 
-        return code
+                if not self.index:
+                    history = (history + block)[-self.window_size:]
+
+            while pending:
+                size, future = pending.popleft()
+                self._write_frame(output, size, future.result(), entries)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        output.write(FRAME.pack(0, 0))
+
+        if self.index:
+            write_index(output, entries)
+
+
+    def block_encoder(self):
+        """
+        Encoder coding the same way as this one, but without its state, such
+        as recorded codes and statistics, or its dictionary, as the history
+        is given along with each block. This is what worker processes are
+        sent by write_blocks.
+        """
+
+        return Lz77Encoder(self.window_size, self.buffer_size, match_finder=self.match_finder,
+                           max_chain=self.max_chain, parser=self.parser,
+                           parse_depth=self.parse_depth, code_format=self.code_format,
+                           overlap=self.overlap)
 
 
     @staticmethod
-    def encode_at_pos(window, buffer):
+    def _write_frame(output, block_size, bitstream, entries):
+        entries.append((output.tell(), block_size))
+        output.write(FRAME.pack(block_size, len(bitstream)))
+        output.write(bitstream)
+
+
+class CodePacker():
+    """
+    Packer of LZ77 codes into a bitstream in one of the code formats. The
+    bits not yet packed into whole bytes and the codes not yet coded in a
+    Huffman block are kept from one call to the next, so that a bitstream
+    can be packed all at once, as by Lz77Encoder.write_codes, or as the
+    codes come, as by Lz77Compressor.
+
+    In the fixed format, codes are packed 8 at a time into a single integer,
+    which then takes up a whole number of bytes, so the bitstream is built
+    with integer shifts instead of a bit at a time.
+
+    In the flagged format, a literal is a 0 bit followed by its 8 bits, and
+    a match is a 1 bit followed by its distance and length. A code with both
+    a match and a symbol is written as a match followed by a literal.
+
+    In the huffman format, every HUFFMAN_BLOCK codes are coded as a block
+    with canonical Huffman tables of its own for the literals and match
+    lengths, and for the match distances; see huffman.write_block.
+    """
+
+    def __init__(self, distance_bits, length_bits, code_format='fixed', record=None):
+        self.distance_bits = distance_bits
+        self.length_bits = length_bits
+        self.code_format = code_format
+        # List to append the codes to as they are packed, if any
+        self.record = record
+        self.output = bytearray()
+        self.bits = 0
+        self.bit_count = 0
+        self.count = 0
+        self.pending = []
+        # Bytes of the message coded by the codes of the bitstream so far
+        self.input_size = 0
+
+
+    def pack(self, codes, size):
         """
-        Perform LZ77 coding at the current position in the input message,
-        characterized by the given sliding window and lookahead buffer.
+        Pack codes until "size" bytes have been packed since the last call
+        to take or finish, or until there are no more codes for now.
 
         Params:
-            window: the sliding window
-            buffer: the lookahead buffer
+            codes: iterator of triples (distance, length, next_sym), which
+                   may give None when it needs more input
+            size: number of packed bytes to stop at
 
         Returns:
-            A triple (distance, length, next_sym) where "distance" is the number
-            of bytes backwards in the message that a match was found for the
-            first "length" number of characters in the lookahead buffer, and
-            "next_sym" is the next character in the lookahead buffer after the
-            matched substring.
-        """
-
-        window_bytes = window.tobytes()
-        buffer_bytes = buffer.tobytes()
-        buffer_len = len(buffer_bytes)
-
-        length = 0
-        substring = b''
-        next_sym = buffer_bytes[length:length + 1]
-
-        while substring + next_sym in window_bytes:
-            substring += next_sym
-            length += 1
-            next_sym = buffer_bytes[length:length + 1]
-            if length == buffer_len - 1 or buffer_len <= 1:
+            Whether it stopped at "size", so that codes may be left.
+        """
+
+        if self.code_format == 'flagged':
+            return self._pack_flagged(codes, size)
+        if self.code_format == 'huffman':
+            return self._pack_huffman(codes, size)
+
+        length_bits = self.length_bits
+        step = self.distance_bits + length_bits + 8
+        distance_shift = length_bits + 8
+        output = self.output
+        record = self.record
+        bits = self.bits
+        bit_count = self.bit_count
+        count = self.count
+        input_size = self.input_size
+        full = False
+
+        for code in codes:
+            if code is None:
+                break
+
+            distance, length, next_sym = code
+
+            if record is not None:
+                record.append(code)
+
+            input_size += length + len(next_sym)
+
+            if not next_sym:
+                # Only the last code can be missing its symbol
+                bits = bits << (step - 8) | distance << length_bits | length
+                bit_count += step - 8
+                break
+
+            bits = bits << step | distance << distance_shift | length << 8 | next_sym[0]
+            bit_count += step
+            count += 1
+
+            if count == 8:
+                output += bits.to_bytes(step, 'big')
+                bits = bit_count = count = 0
+
+                if len(output) >= size:
+                    full = True
+                    break
+
+        self.bits = bits
+        self.bit_count = bit_count
+        self.count = count
+        self.input_size = input_size
+
+        return full
+
+
+    def _pack_flagged(self, codes, size):
+        match_bits = 1 + self.distance_bits + self.length_bits
+        match_flag = 1 << (match_bits - 1)
+        length_bits = self.length_bits
+        output = self.output
+        record = self.record
+        bits = self.bits
+        bit_count = self.bit_count
+        input_size = self.input_size
+        full = False
+
+        for code in codes:
+            if code is None:
+                break
+
+            distance, length, next_sym = code
+
+            if record is not None:
+                record.append(code)
+
+            input_size += length + len(next_sym)
+
+            if length:
+                bits = bits << match_bits | match_flag | distance << length_bits | length
+                bit_count += match_bits
+
+            if next_sym:
+                bits = bits << 9 | next_sym[0]
+                bit_count += 9
+
+            if bit_count >= 4096:
+                spare = bit_count & 7
+                output += (bits >> spare).to_bytes(bit_count >> 3, 'big')
+                bits &= (1 << spare) - 1
+                bit_count = spare
+
+                if len(output) >= size:
+                    full = True
+                    break
+
+        self.bits = bits
+        self.bit_count = bit_count
+        self.input_size = input_size
+
+        return full
+
+
+    def _pack_huffman(self, codes, size):
+        record = self.record
+
+        for code in codes:
+            if code is None:
                 break
 
-        if length > 0:
-            distance = window_bytes[::-1].index(substring[::-1]) + length
+            if record is not None:
+                record.append(code)
+
+            self.input_size += code[1] + len(code[2])
+            self.pending.append(code)
+
+            if len(self.pending) == HUFFMAN_BLOCK:
+                self.bits, self.bit_count = write_block(self.output, self.bits, self.bit_count,
+                                                        self.pending, False)
+                self.pending = []
+
+                if len(self.output) >= size:
+                    return True
+
+        return False
+
+
+    def take(self):
+        """
+        Take the bytes packed since the last call to take or finish.
+
+        Returns:
+            The packed bytes, as a bytearray.
+        """
+
+        output = self.output
+        self.output = bytearray()
+        return output
+
+
+    def finish(self):
+        """
+        End the bitstream, coding the codes left as the last Huffman block
+        and padding the bits left up to a whole byte. The packer then starts
+        a new bitstream.
+
+        Returns:
+            The bytes packed since the last call to take or finish, as a
+            bytearray.
+        """
+
+        if self.code_format == 'huffman':
+            # The last block is decoded on its own
+            self.bits, self.bit_count = write_block(self.output, self.bits, self.bit_count,
+                                                    self.pending, True)
+            self.pending = []
+
+        padding = -self.bit_count % 8
+        self.output += (self.bits << padding).to_bytes((self.bit_count + padding) // 8, 'big')
+
+        self.bits = self.bit_count = self.count = 0
+        self.input_size = 0
+
+        return self.take()
+
+
+class Lz77Compressor():
+    """
+    Incremental LZ77 compressor for data that arrives in chunks, in the
+    manner of zlib.compressobj.
+
+    The output is split into frames as in Lz77Encoder.write_blocks, but the
+    codes run on across frames, with the sliding window and the codes not yet
+    packed into a whole frame kept between calls. The original size and
+    CRC32 are only known at the end, so they follow the last frame.
+    """
+
+    def __init__(self, window_size, buffer_size, frame_size=FLUSH_SIZE, **options):
+        self.encoder = Lz77Encoder(window_size, buffer_size, **options)
+        self.frame_size = frame_size
+        history = self.encoder.preset_history()
+        self.window = SlidingWindow(window_size, self.encoder.lookahead_size(),
+                                    data=history, fed=True)
+        self.window.pos = len(history)
+        self.codes = self.encoder._encode_window(self.window)
+        self.header = self.encoder.make_header()
+        self.header.flags |= FLAG_BLOCKS | FLAG_STORED | FLAG_TRAILER
+        self.size = 0
+        self.crc32 = 0
+        self.started = False
+        self.finished = False
+        self.packer = CodePacker(self.encoder.distance_bits, self.encoder.length_bits,
+                                 self.encoder.code_format,
+                                 self.encoder.compression if self.encoder.record_codes else None)
+        self.coded = len(history)
+
+
+    def compress(self, data):
+        """
+        Compress a chunk of data.
+
+        The chunk is coded as far as the lookahead buffer allows, but the
+        output is only returned a whole frame at a time, so it is usually
+        empty for small chunks; see flush.
+
+        Params:
+            data: the chunk, as any object supporting the buffer protocol
+
+        Returns:
+            Compressed data, as bytes.
+        """
+
+        if self.finished:
+            raise ValueError('Compressor has already been flushed')
+
+        self.size += len(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+        self.window.append(data)
+
+        return bytes(self._start() + self._pack())
+
+
+    def flush(self, finish=True):
+        """
+        Code all the data given so far and return the rest of the output.
+
+        Params:
+            finish: if set, end the stream, after which no more data can be
+                    compressed. Otherwise the stream can carry on, but its
+                    last frame ends here, so all the data given so far can
+                    be decoded from the output.
+
+        Returns:
+            Compressed data, as bytes.
+        """
+
+        if self.finished:
+            raise ValueError('Compressor has already been flushed')
+
+        if finish:
+            self.window.close()
+        else:
+            # Code up to the end of the input, whatever the lookahead
+            lookahead_size = self.window.lookahead_size
+            self.window.lookahead_size = 0
+
+        output = self._start() + self._pack()
+        output += self._end_frame()
+
+        if finish:
+            output += FRAME.pack(0, 0)
+            output += TRAILER.pack(self.size, self.crc32)
+            self.finished = True
         else:
-            distance = 0
+            self.window.lookahead_size = lookahead_size
 
-        return (distance, length, next_sym)
+        return bytes(output)
 
 
-if __name__ == '__main__':
-    import sys
-    import time
+    def _start(self):
+        if self.started:
+            return bytearray()
+
+        self.started = True
+        return bytearray(self.header.pack())
+
+
+    def _pack(self):
+        # Pack codes until the window runs out of input, ending a frame
+        # each time one is full
+        output = bytearray()
+
+        while self.packer.pack(self.codes, self.frame_size):
+            output += self._end_frame()
+
+        return output
+
+
+    def _end_frame(self):
+        frame_input = self.packer.input_size
+        if not frame_input:
+            return b''
+
+        # Each frame ends its bitstream, to be decoded on its own
+        frame = self.packer.finish()
+
+        # Store the frame's input instead if it did not compress, as long as
+        # the window still holds all of it
+        frame_start = self.coded - self.window.offset
+        self.coded += frame_input
+
+        if len(frame) >= frame_input and frame_start >= 0:
+            frame = self.window.data[frame_start:frame_start + frame_input]
+        elif len(frame) == frame_input:
+            # A bitstream as large as its block is read as the block stored
+            # as is, so it gets a byte of padding, which decoders skip as
+            # they stop at the end of the block
+            frame += b'\0'
+
+        return FRAME.pack(frame_input, len(frame)) + frame
+
+
+def parse_lazy(lengths, costs, symbols=True):
+    """
+    Choose the codes for a block greedily, but with one step of lookahead:
+    the match at a position is deferred, coding a literal instead, when the
+    next position has a longer match and a literal costs less than a match.
+    Matches that cost more than coding their bytes as literals are dropped.
+
+    Params:
+        lengths: length of the longest match at each position of the block
+        costs: size in bits of a code for each match length
+        symbols: whether each code also holds the symbol after the match. If
+                 not, a length of 0 stands for a literal.
+
+    Returns:
+        List of pairs (position in the block, match length) for the codes.
+        The last code may reach past the end of the block.
+    """
+
+    block_len = len(lengths)
+    extra = 1 if symbols else 0
+    choices = []
+    pos = 0
+
+    while pos < block_len:
+        length = lengths[pos]
+
+        if length and costs[length] > costs[0] * (length + extra):
+            length = 0
+        elif (length and pos + 1 < block_len and lengths[pos + 1] > length
+              and costs[0] < costs[length]):
+            length = 0
+
+        choices.append((pos, length))
+        pos += max(length + extra, 1)
+
+    return choices
+
+
+def parse_optimal(lengths, costs, depth=None, symbols=True):
+    """
+    Choose the codes for a block that code it in the fewest bits, by
+    dynamic programming from the end of the block backwards. Any prefix of
+    the longest match at a position is also a match, so each position may
+    be coded with any shorter length, or as a literal.
+
+    Params:
+        lengths: length of the longest match at each position of the block
+        costs: size in bits of a code for each match length
+        depth: number of lengths to try at each position, counting down
+               from the longest, besides a literal. None tries all of them.
+        symbols: whether each code also holds the symbol after the match. If
+                 not, a length of 0 stands for a literal.
+
+    Returns:
+        List of pairs (position in the block, match length) for the codes.
+        The last code may reach past the end of the block.
+    """
+
+    block_len = len(lengths)
+    extra = 1 if symbols else 0
+    # Codes reaching past the end of the block cost nothing more
+    total = [0] * (block_len + len(costs) + 1)
+    best = [0] * block_len
+
+    for pos in range(block_len - 1, -1, -1):
+        longest = lengths[pos]
+        shortest = 1 if depth is None else max(longest - depth + 1, 1)
+        best_length = 0
+        best_total = costs[0] + total[pos + 1]
+
+        for length in range(longest, shortest - 1, -1):
+            length_total = costs[length] + total[pos + length + extra]
+            if length_total < best_total:
+                best_length = length
+                best_total = length_total
+
+        best[pos] = best_length
+        total[pos] = best_total
+
+    choices = []
+    pos = 0
+
+    while pos < block_len:
+        choices.append((pos, best[pos]))
+        pos += max(best[pos] + extra, 1)
+
+    return choices
+
+
+def looks_incompressible(data):
+    """
+    Guess whether data is compressed already, or random, from the entropy
+    of the bytes in a sample of it, so that it can be stored without
+    searching it for matches.
+
+    Params:
+        data: the data, as bytes or a memory mapped file
 
-    FILE = sys.argv[1]
-    W = int(sys.argv[2])
-    L = int(sys.argv[3])
+    Returns:
+        True if the sample's entropy is above STORED_ENTROPY.
+    """
 
-    encoder = Lz77Encoder(W, L)
+    if len(data) < MIN_ENTROPY_SAMPLE:
+        return False
+
+    if len(data) <= ENTROPY_SAMPLE:
+        sample = data[:]
+    else:
+        # Pieces spread evenly over the data, as files often start with
+        # headers unlike the rest of them
+        piece_size = MIN_ENTROPY_SAMPLE
+        pieces = ENTROPY_SAMPLE // piece_size
+        stride = (len(data) - piece_size) // (pieces - 1)
+        sample = b''.join(data[index * stride:index * stride + piece_size]
+                          for index in range(pieces))
+
+    size = len(sample)
+    entropy = -sum(count * math.log2(count / size) for count in Counter(sample).values()) / size
+
+    return entropy > STORED_ENTROPY
+
+
+def train_dictionary(samples, size=DICTIONARY_SIZE, segment_size=DICTIONARY_SEGMENT):
+    """
+    Build a preset dictionary from sample messages, for coding small messages
+    that are alike, such as records of the same format.
+
+    Substrings of segment_size bytes are counted once per sample they occur
+    in. Starting from the most common ones, each is grown on both sides in
+    the sample it was first seen in, for as long as the substrings there are
+    about as common, so that shared runs such as a header line are taken
+    whole. The runs are joined with the most common last, where they are
+    closest to the data and cheapest to refer to.
+
+    Params:
+        samples: iterable of sample messages, as bytes
+        size: maximum size of the dictionary in bytes
+        segment_size: length of the substrings counted
+
+    Returns:
+        The dictionary, as bytes.
+    """
+
+    samples = [bytes(sample) for sample in samples]
+    counts = Counter()
+    first_seen = {}
+
+    for index, sample in enumerate(samples):
+        segments = {}
+        for pos in range(len(sample) - segment_size + 1):
+            segments.setdefault(sample[pos:pos + segment_size], pos)
+
+        counts.update(segments.keys())
+        for segment, pos in segments.items():
+            first_seen.setdefault(segment, (index, pos))
+
+    pieces = []
+    total = 0
+    taken = set()
+
+    for segment, count in counts.most_common():
+        if count < 2 or total >= size:
+            break
+        if segment in taken:
+            continue
+
+        index, start = first_seen[segment]
+        sample = samples[index]
+        end = start + segment_size
+        min_count = (count + 1) // 2
+
+        while start > 0:
+            previous = sample[start - 1:start - 1 + segment_size]
+            if previous in taken or counts[previous] < min_count:
+                break
+            start -= 1
+
+        while end < len(sample):
+            following = sample[end + 1 - segment_size:end + 1]
+            if following in taken or counts[following] < min_count:
+                break
+            end += 1
+
+        for pos in range(start, end - segment_size + 1):
+            taken.add(sample[pos:pos + segment_size])
+
+        pieces.append(sample[start:end])
+        total += end - start
+
+    return b''.join(reversed(pieces))[-size:]
+
+
+def compress_bytes(data, window_size, buffer_size, **options):
+    """
+    Compress a message in memory using LZ77 coding.
+
+    Params:
+        data: the message, as any object supporting the buffer protocol
+        window_size: size of the sliding window
+        buffer_size: size of the lookahead buffer
+        options: further arguments to Lz77Encoder
+
+    Returns:
+        The compressed message.
+    """
+
+    return Lz77Encoder(window_size, buffer_size, **options).compress_bytes(data)
+
+
+def encode_block(encoder, history, block):
+    """
+    Code one block of a file for Lz77Encoder.write_blocks. This runs in a
+    worker process, so it is a module-level function.
+
+    Params:
+        encoder: the encoder whose parameters to use
+        history: the data preceding the block
+        block: the data to code
+
+    Returns:
+        The bitstream of the block, padded to a whole byte, or the block
+        itself if that is no larger.
+    """
+
+    if looks_incompressible(block):
+        return block
+
+    output = io.BytesIO()
+    encoder.write_codes(encoder.encode(block, history), output)
+    bitstream = output.getvalue()
+
+    # A bitstream as large as its block is read as the block stored as is
+    if len(bitstream) >= len(block):
+        return block
+    return bitstream
+
+
+def add_arguments(parser):
+    """ Add the encoder's command line arguments to an argparse parser """
+    parser.add_argument('file')
+    parser.add_argument('window_size', type=int)
+    parser.add_argument('buffer_size', type=int)
+    parser.add_argument('--match-finder', choices=MATCH_FINDERS, default='hash_chain')
+    parser.add_argument('--workers', type=int,
+                        help='code the file as blocks in this many processes')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE,
+                        help='size of the blocks in bytes when using --workers')
+    parser.add_argument('--index', action='store_true',
+                        help='code blocks on their own and index them, when using --workers')
+    parser.add_argument('--parser', choices=PARSERS, default='greedy')
+    parser.add_argument('--level', type=int, choices=sorted(LEVELS),
+                        help='compression level, which sets the parser and search depth')
+    parser.add_argument('--code-format', choices=CODE_FORMATS, default='fixed')
+    parser.add_argument('--overlap', action='store_true',
+                        help='let matches run on into the lookahead buffer')
+    parser.add_argument('--dictionary',
+                        help='file holding a preset dictionary to prime the window with')
+    parser.add_argument('--mmap', action='store_true',
+                        help='memory map the input file instead of reading it')
+    parser.add_argument('--stats', action='store_true',
+                        help='report time per phase, code counts and histograms')
+
+
+def run(args):
+    """ Compress a file as the command line arguments say, and report on it """
+    FILE = args.file
+    W = args.window_size
+    L = args.buffer_size
+
+    dictionary = b''
+    if args.dictionary:
+        with open(args.dictionary, 'rb') as dictionary_file:
+            dictionary = dictionary_file.read()
+
+    encoder = Lz77Encoder(W, L, match_finder=args.match_finder,
+                          workers=args.workers, block_size=args.block_size,
+                          index=args.index, use_mmap=args.mmap,
+                          parser=args.parser, level=args.level,
+                          code_format=args.code_format, overlap=args.overlap,
+                          dictionary=dictionary, collect_stats=args.stats)
 
     uncompressed_size = os.path.getsize(FILE)
 
     start = time.time()
-    encoder.compress(FILE)
+    stats = encoder.compress(FILE)
     end = time.time()
 
     runtime = end - start
@@ -179,4 +1471,16 @@ if __name__ == '__main__':
     print(f'Compressed size:   {compressed_size} bytes')
     print(f'Compression ratio: {round(ratio, 2)}')
     print(f'Running time:      {round(runtime, 2)} seconds')
-    print('-----------------------------------------')
\ No newline at end of file
+    print('-----------------------------------------')
+
+    if stats is not None:
+        print(stats.report())
+        print('-----------------------------------------')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='LZ77 Encoder')
+    add_arguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,341 @@
+""" Digital Communication - Lempel-Ziv Huffman coding """
+
+import heapq
+
+
+SYMBOLS = [bytes([value]) for value in range(256)]
+
+# The literal/length alphabet holds the 256 literals, the end of a block,
+# then the length buckets. Match lengths and distances are coded as the
+# bucket of their value minus one, followed by its extra bits, in the
+# manner of DEFLATE.
+END_OF_BLOCK = 256
+LENGTH_BASE = 257
+BUCKETS = 64
+LITERAL_SYMBOLS = LENGTH_BASE + BUCKETS
+
+MAX_CODE_LENGTH = 15
+
+# Codes taken from the encoder before a block is coded with its own tables
+HUFFMAN_BLOCK = 1 << 14
+
+# Values 0 to 3 have a bucket each, and from then on every power of two is
+# split into two buckets, with the bits below the top two sent as they are
+BUCKET_EXTRA_BITS = [0, 0, 0, 0] + [(bucket - 2) // 2 for bucket in range(4, BUCKETS)]
+BUCKET_BASES = [0, 1, 2, 3] + [(2 | bucket & 1) << BUCKET_EXTRA_BITS[bucket]
+                               for bucket in range(4, BUCKETS)]
+
+# Decoding table entry for bit patterns that are not a code
+INVALID = -1
+
+
+def bucket(value):
+    """
+    Bucket of a length or distance, counting from 0.
+
+    Returns:
+        A pair (bucket, number of extra bits).
+    """
+
+    if value < 4:
+        return value, 0
+
+    extra_bits = value.bit_length() - 2
+    return 2 * extra_bits + 2 + (value >> extra_bits & 1), extra_bits
+
+
+def code_lengths(counts, max_length=MAX_CODE_LENGTH):
+    """
+    Lengths of a Huffman code for symbols with the given counts, none of
+    them longer than max_length. If the plain Huffman code is too long, the
+    counts are halved until it fits, which costs little as it only happens
+    for very skewed counts.
+
+    Params:
+        counts: number of times each symbol occurs
+
+    Returns:
+        List of the code length of each symbol, 0 for unused symbols.
+    """
+
+    lengths = [0] * len(counts)
+    used = [symbol for symbol, count in enumerate(counts) if count]
+
+    if len(used) == 1:
+        lengths[used[0]] = 1
+        return lengths
+
+    while True:
+        heap = [(counts[symbol], index, [symbol]) for index, symbol in enumerate(used)]
+        heapq.heapify(heap)
+        next_index = len(heap)
+
+        for symbol in used:
+            lengths[symbol] = 0
+
+        while len(heap) > 1:
+            count_a, _, symbols_a = heapq.heappop(heap)
+            count_b, _, symbols_b = heapq.heappop(heap)
+
+            for symbol in symbols_a:
+                lengths[symbol] += 1
+            for symbol in symbols_b:
+                lengths[symbol] += 1
+
+            heapq.heappush(heap, (count_a + count_b, next_index, symbols_a + symbols_b))
+            next_index += 1
+
+        if max(lengths, default=0) <= max_length:
+            return lengths
+
+        counts = [count // 2 + 1 if count else 0 for count in counts]
+
+
+def canonical_codes(lengths):
+    """
+    Canonical Huffman code for the given code lengths: codes of the same
+    length are consecutive, in the order of their symbols, so the lengths
+    are all a decoder needs to rebuild the code.
+
+    Returns:
+        List of the code of each symbol, 0 for unused symbols.
+    """
+
+    codes = [0] * len(lengths)
+    code = 0
+    previous_length = 0
+
+    for length, symbol in sorted((length, symbol) for symbol, length in enumerate(lengths) if length):
+        code <<= length - previous_length
+        codes[symbol] = code
+        code += 1
+        previous_length = length
+
+    return codes
+
+
+def decoding_table(lengths):
+    """
+    Table for decoding a canonical Huffman code by looking up its next
+    bits, as many as the longest code.
+
+    Returns:
+        A pair (table, longest code length). Each entry of the table holds
+        the symbol shifted left by 4, or'ed with its code length, or INVALID.
+    """
+
+    max_length = max(lengths, default=0)
+    table = [INVALID] * (1 << max_length)
+
+    for symbol, code in enumerate(canonical_codes(lengths)):
+        length = lengths[symbol]
+
+        if length:
+            shift = max_length - length
+            table[code << shift:(code + 1) << shift] = [symbol << 4 | length] * (1 << shift)
+
+    return table, max_length
+
+
+def write_block(output, bits, bit_count, codes, last):
+    """
+    Code LZ77 codes as one Huffman block, with a table of its own.
+
+    The block starts with a bit telling whether it is the last one, the
+    numbers of length and distance buckets in use, then the code length of
+    every symbol in 4 bits. The codes follow, and the end of block symbol.
+
+    The bits are appended to an integer holding those not yet packed into
+    whole bytes, and bytes are moved from it to the output as it grows.
+
+    Params:
+        output: bytearray to append the packed bytes to
+        bits: integer holding the bits not yet packed
+        bit_count: number of bits in "bits"
+        codes: list of triples (distance, length, next_sym)
+        last: whether this is the last block of the bitstream
+
+    Returns:
+        The new (bits, bit_count).
+    """
+
+    literal_counts = [0] * LITERAL_SYMBOLS
+    distance_counts = [0] * BUCKETS
+    tokens = []
+
+    for distance, length, next_sym in codes:
+        if length:
+            length_bucket, length_extra = bucket(length - 1)
+            distance_bucket, distance_extra = bucket(distance - 1)
+            literal_counts[LENGTH_BASE + length_bucket] += 1
+            distance_counts[distance_bucket] += 1
+            tokens.append((LENGTH_BASE + length_bucket, length_extra, length - 1,
+                           distance_bucket, distance_extra, distance - 1))
+
+        if next_sym:
+            literal_counts[next_sym[0]] += 1
+            tokens.append(next_sym[0])
+
+    literal_counts[END_OF_BLOCK] += 1
+
+    literal_lengths = code_lengths(literal_counts)
+    distance_lengths = code_lengths(distance_counts)
+    literal_codes = canonical_codes(literal_lengths)
+    distance_codes = canonical_codes(distance_lengths)
+
+    literal_used = max(symbol for symbol, length in enumerate(literal_lengths) if length) + 1
+    distance_used = max((symbol + 1 for symbol, length in enumerate(distance_lengths) if length),
+                        default=0)
+
+    bits = bits << 15 | last << 14 | (literal_used - LENGTH_BASE) << 7 | distance_used
+    bit_count += 15
+
+    for length in literal_lengths[:literal_used] + distance_lengths[:distance_used]:
+        bits = bits << 4 | length
+    bit_count += 4 * (literal_used + distance_used)
+
+    tokens.append(END_OF_BLOCK)
+
+    for token in tokens:
+        if token.__class__ is int:
+            length = literal_lengths[token]
+            bits = bits << length | literal_codes[token]
+            bit_count += length
+        else:
+            symbol, length_extra, length, distance_symbol, distance_extra, distance = token
+
+            code_length = literal_lengths[symbol]
+            bits = bits << code_length | literal_codes[symbol]
+            bits = bits << length_extra | length & ((1 << length_extra) - 1)
+
+            distance_length = distance_lengths[distance_symbol]
+            bits = bits << distance_length | distance_codes[distance_symbol]
+            bits = bits << distance_extra | distance & ((1 << distance_extra) - 1)
+
+            bit_count += code_length + length_extra + distance_length + distance_extra
+
+        if bit_count >= 4096:
+            spare = bit_count & 7
+            output += (bits >> spare).to_bytes(bit_count >> 3, 'big')
+            bits &= (1 << spare) - 1
+            bit_count = spare
+
+    return bits, bit_count
+
+
+def read_codes(blocks):
+    """
+    Decode the Huffman blocks of a bitstream, as written by write_block,
+    up to and including the last one.
+
+    Each symbol is decoded with a single lookup of the next bits in a table
+    built from the block's code lengths, rather than bit by bit.
+
+    Params:
+        blocks: iterable of pieces of the bitstream, as bytes-like objects
+
+    Returns:
+        Generator of triples (distance, length, next_sym), each either a
+        match with no symbol or a literal.
+
+    Raises:
+        ValueError: if the bitstream is truncated or corrupt
+    """
+
+    pieces = (block[piece_start:piece_start + 32]
+              for block in blocks for piece_start in range(0, len(block), 32))
+    state = [0, 0, 0]
+    last = False
+
+    while not last:
+        # The table of a block is at most 15 + 4 * 385 bits
+        bits, bit_count = _refill(pieces, state, 1600)
+
+        bit_count -= 15
+        header = bits >> bit_count & 0x7FFF
+        last = header >> 14 & 1
+        literal_used = (header >> 7 & 0x7F) + LENGTH_BASE
+        distance_used = header & 0x7F
+
+        if literal_used > LITERAL_SYMBOLS or distance_used > BUCKETS:
+            raise ValueError('Invalid Huffman block header')
+
+        lengths = []
+        for _ in range(literal_used + distance_used):
+            bit_count -= 4
+            lengths.append(bits >> bit_count & 0xF)
+
+        literal_table, literal_max = decoding_table(lengths[:literal_used])
+        distance_table, distance_max = decoding_table(lengths[literal_used:])
+        literal_mask = (1 << literal_max) - 1
+        distance_mask = (1 << distance_max) - 1
+
+        while True:
+            if bit_count < 128:
+                state[0] = bits
+                state[1] = bit_count
+                bits, bit_count = _refill(pieces, state, 128)
+
+            entry = literal_table[bits >> (bit_count - literal_max) & literal_mask]
+            if entry < 0:
+                raise ValueError('Invalid Huffman code')
+
+            bit_count -= entry & 0xF
+            symbol = entry >> 4
+
+            if symbol < END_OF_BLOCK:
+                yield (0, 0, SYMBOLS[symbol])
+                continue
+
+            if symbol == END_OF_BLOCK:
+                break
+
+            symbol -= LENGTH_BASE
+            extra_bits = BUCKET_EXTRA_BITS[symbol]
+            length = BUCKET_BASES[symbol] + 1
+            if extra_bits:
+                bit_count -= extra_bits
+                length += bits >> bit_count & ((1 << extra_bits) - 1)
+
+            entry = distance_table[bits >> (bit_count - distance_max) & distance_mask]
+            if entry < 0:
+                raise ValueError('Invalid Huffman code')
+
+            bit_count -= entry & 0xF
+            symbol = entry >> 4
+            extra_bits = BUCKET_EXTRA_BITS[symbol]
+            distance = BUCKET_BASES[symbol] + 1
+            if extra_bits:
+                bit_count -= extra_bits
+                distance += bits >> bit_count & ((1 << extra_bits) - 1)
+
+            yield (distance, length, b'')
+
+        state[0] = bits
+        state[1] = bit_count
+
+    if state[1] < state[2]:
+        raise ValueError('Compressed data is truncated')
+
+
+def _refill(pieces, state, need):
+    # Top up the bit buffer held in state as [bits, bit_count, padding] to
+    # at least "need" bits. Past the end of the input, zero bits are added
+    # as padding, and reading into them means the input is truncated.
+    bits, bit_count, padding = state
+
+    if bit_count < padding:
+        raise ValueError('Compressed data is truncated')
+
+    while bit_count < need:
+        piece = next(pieces, None)
+
+        if piece is None:
+            piece = bytes(32)
+            padding += 256
+
+        bits = (bits & ((1 << bit_count) - 1)) << (len(piece) << 3) | int.from_bytes(piece, 'big')
+        bit_count += len(piece) << 3
+
+    state[:] = bits, bit_count, padding
+    return bits, bit_count
@@ -0,0 +1,58 @@
+""" Digital Communication - Lempel-Ziv command line
+
+Usage: python -m lz77 {compress,decompress,bench,plot} ...
+
+Each command only imports the modules it needs when it runs, so compressing
+or decompressing a file starts about as fast as running encoder.py or
+decoder.py, without loading the benchmarks, matplotlib or NumPy.
+"""
+
+import argparse
+import importlib
+import sys
+
+
+# Command name, module implementing it and its description. Each module has
+# add_arguments(parser) and run(args) functions.
+COMMANDS = (
+    ('compress', 'encoder', 'compress a file, replacing it with a .LZ77 file'),
+    ('decompress', 'decoder', 'decompress a .LZ77 file, replacing it with the original'),
+    ('bench', 'benchmark', 'time in-memory compression and decompression of a file'),
+    ('plot', 'plotting', 'run analyses and save their plots in plots/'),
+)
+
+
+def main(argv=None):
+    """
+    Run the command named by the command line arguments.
+
+    Params:
+        argv: list of the arguments, or None for those of the process
+    """
+
+    parser = argparse.ArgumentParser(prog='lz77', description='LZ77 coding')
+    commands = parser.add_subparsers(dest='command', metavar='command', required=True)
+    command_modules = {}
+
+    for name, module_name, description in COMMANDS:
+        command_parser = commands.add_parser(name, help=description, description=description)
+        command_modules[name] = (module_name, command_parser)
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # Only the chosen command's module is imported, to add its arguments
+    # and run it. The command is the first argument that is not an option.
+    command = next((arg for arg in argv if not arg.startswith('-')), None)
+
+    if command in command_modules:
+        module_name, command_parser = command_modules[command]
+        module = importlib.import_module(module_name)
+        module.add_arguments(command_parser)
+
+    args = parser.parse_args(argv)
+    module.run(args)
+
+
+if __name__ == '__main__':
+    main()
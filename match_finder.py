@@ -0,0 +1,616 @@
+""" Digital Communication - Lempel-Ziv match finders """
+
+
+MIN_MATCH = 3
+
+# Positions that a binary tree search visits at most beyond the path to the
+# current data, to find matches that do not run into the lookahead buffer
+FAR_SEARCH = 32
+
+# Prefix lengths that MatchIndex keeps hash chains for
+INDEX_KEY_LENGTHS = (MIN_MATCH, 4, 5, 6, 8, 12, 16, 24, 32)
+
+
+class HashChainMatchFinder():
+    """
+    Match finder that hashes 3-byte prefixes into head/prev chains over the
+    sliding window.
+
+    Positions are inserted once as the encoder moves past them. Searching
+    walks the chain for the current prefix from the most recent position
+    backwards, so that the longest match closest to the current position is
+    found first.
+
+    The chains hold positions in the whole message, while "data" only holds
+    the part of it from "offset" onwards; see slide().
+
+    If "overlap" is set, matches may be longer than their distance, running
+    on into the lookahead buffer.
+    """
+
+    def __init__(self, window_size, max_chain=None, overlap=False):
+        self.window_size = window_size
+        self.max_chain = max_chain
+        self.overlap = overlap
+        self.offset = 0
+        self.head = {}
+        self.prev = [-1] * window_size
+
+
+    def reset(self):
+        """ Forget all inserted positions """
+        self.offset = 0
+        self.head = {}
+        self.prev = [-1] * self.window_size
+
+
+    def slide(self, dropped):
+        """
+        Account for bytes dropped from the front of the data, and forget the
+        positions that were dropped with them.
+        """
+
+        self.offset += dropped
+        self.head = {key: pos for key, pos in self.head.items() if pos >= self.offset}
+
+
+    def insert(self, data, pos):
+        """
+        Insert the 3-byte prefix starting at the given position into the
+        hash chains.
+
+        Params:
+            data: the input message
+            pos: position in data to insert
+        """
+
+        if pos + MIN_MATCH > len(data):
+            return
+
+        key = data[pos] << 16 | data[pos + 1] << 8 | data[pos + 2]
+        pos += self.offset
+        self.prev[pos % self.window_size] = self.head.get(key, -1)
+        self.head[key] = pos
+
+
+    def insert_range(self, data, start, end, final=True):
+        """
+        Insert every position in [start, end) into the hash chains. Only
+        the 3-byte prefixes are hashed, so "final" makes no difference; see
+        BinaryTreeMatchFinder.insert_range.
+        """
+
+        head = self.head
+        prev = self.prev
+        window_size = self.window_size
+        offset = self.offset
+
+        for pos in range(start, min(end, len(data) - MIN_MATCH + 1)):
+            key = data[pos] << 16 | data[pos + 1] << 8 | data[pos + 2]
+            prev[(pos + offset) % window_size] = head.get(key, -1)
+            head[key] = pos + offset
+
+
+    def find(self, data, pos, max_length):
+        """
+        Find the longest match for the data at the given position in the
+        sliding window preceding it.
+
+        Params:
+            data: the input message
+            pos: current position in data
+            max_length: upper bound on the length of the match
+
+        Returns:
+            A pair (distance, length), where "distance" is how many bytes
+            backwards the match was found. If there is no match, (0, 0) is
+            returned.
+        """
+
+        window_start = max(pos - self.window_size, 0)
+        best_length = 0
+        best_pos = -1
+
+        if max_length >= MIN_MATCH and pos + MIN_MATCH <= len(data):
+            key = data[pos] << 16 | data[pos + 1] << 8 | data[pos + 2]
+            offset = self.offset
+            candidate = self.head.get(key, -1) - offset
+            chain = self.max_chain
+            prev = self.prev
+            window_size = self.window_size
+            overlap = self.overlap
+
+            while candidate >= window_start:
+                limit = max_length if overlap else min(max_length, pos - candidate)
+
+                if (limit > best_length
+                        and data[candidate + best_length] == data[pos + best_length]):
+                    length = match_length(data, candidate, pos, limit)
+
+                    if length > best_length:
+                        best_length = length
+                        best_pos = candidate
+
+                        if length == max_length:
+                            break
+
+                if chain is not None:
+                    chain -= 1
+                    if chain <= 0:
+                        break
+
+                next_candidate = prev[(candidate + offset) % window_size] - offset
+                if next_candidate >= candidate:
+                    break
+                candidate = next_candidate
+
+        if best_length >= MIN_MATCH:
+            return pos - best_pos, best_length
+
+        return find_short_match(data, pos, window_start, max_length, self.overlap)
+
+
+class BinaryTreeMatchFinder():
+    """
+    Match finder that keeps the positions sharing a 3-byte prefix in a
+    binary search tree ordered by the data following them.
+
+    Every new position becomes the root of its tree, so the tree is also
+    ordered by age: a search follows the path to the positions whose data
+    is closest to the current one, plus at most FAR_SEARCH positions off it
+    where matches run into the lookahead buffer. The cost is placing every
+    position, coded or not, with a walk down its tree, so it pays off over
+    hash chains with large windows on data whose chains grow long, such as
+    images, and not on text with long repeats, where few positions are
+    searched at all.
+
+    If "overlap" is set, matches may be longer than their distance, running
+    on into the lookahead buffer.
+    """
+
+    def __init__(self, window_size, buffer_size, max_chain=None, overlap=False):
+        self.window_size = window_size
+        self.buffer_size = buffer_size
+        self.max_chain = max_chain
+        self.overlap = overlap
+        self.offset = 0
+        self.head = {}
+        self.left = [-1] * (window_size + 1)
+        self.right = [-1] * (window_size + 1)
+        # First position held back by insert_range until the data after it
+        # is there, or None
+        self.deferred = None
+
+
+    def reset(self):
+        """ Forget all inserted positions """
+        self.offset = 0
+        self.head = {}
+        self.deferred = None
+        self.left = [-1] * (self.window_size + 1)
+        self.right = [-1] * (self.window_size + 1)
+
+
+    def slide(self, dropped):
+        """
+        Account for bytes dropped from the front of the data, and forget the
+        positions that were dropped with them.
+        """
+
+        self.offset += dropped
+        self.head = {key: pos for key, pos in self.head.items() if pos >= self.offset}
+
+
+    def insert(self, data, pos):
+        """
+        Insert the position into the tree for its 3-byte prefix, making it
+        the new root.
+
+        Params:
+            data: the input message
+            pos: position in data to insert
+        """
+
+        data_len = len(data)
+
+        if pos + MIN_MATCH > data_len:
+            return
+
+        key = data[pos] << 16 | data[pos + 1] << 8 | data[pos + 2]
+        left = self.left
+        right = self.right
+        cycle = self.window_size + 1
+        offset = self.offset
+        window_start = max(pos - self.window_size, 0)
+        limit = min(self.buffer_size, data_len - pos)
+        chain = self.max_chain
+
+        candidate = self.head.get(key, -1) - offset
+        self.head[key] = pos + offset
+
+        # The slots still waiting for a child: positions smaller than pos are
+        # hung off left_slot, larger ones off right_slot.
+        left_slot = (left, (pos + offset) % cycle)
+        right_slot = (right, (pos + offset) % cycle)
+        left_length = right_length = 0
+
+        while candidate >= window_start:
+            slot = (candidate + offset) % cycle
+            length = min(left_length, right_length)
+            if data[candidate + length] == data[pos + length]:
+                length += match_length(data, candidate + length, pos + length,
+                                       limit - length)
+
+            if length == limit and self.overlap:
+                # The older position matches as far as the buffer reaches,
+                # so it is no use with this one in front of it. Without
+                # overlap it is kept, as it may allow a longer match.
+                left_slot[0][left_slot[1]] = left[slot]
+                right_slot[0][right_slot[1]] = right[slot]
+                return
+
+            if chain is not None:
+                chain -= 1
+                if chain < 0:
+                    break
+
+            if length < limit and data[candidate + length] < data[pos + length]:
+                left_slot[0][left_slot[1]] = candidate + offset
+                left_slot = (right, slot)
+                left_length = length
+                candidate = right[slot] - offset
+            else:
+                right_slot[0][right_slot[1]] = candidate + offset
+                right_slot = (left, slot)
+                right_length = length
+                candidate = left[slot] - offset
+
+        left_slot[0][left_slot[1]] = -1
+        right_slot[0][right_slot[1]] = -1
+
+
+    def insert_range(self, data, start, end, final=True):
+        """
+        Insert every position in [start, end) into the trees, after the
+        ones held back before.
+
+        A position is placed in its tree by comparing up to buffer_size
+        bytes, so unless "final" is set, meaning that no data will follow,
+        the positions less than buffer_size bytes from the end of the data
+        are held back until the data after them is there. Otherwise the
+        order of the tree would not hold once it is.
+        """
+
+        if self.deferred is not None:
+            start = min(start, max(self.deferred - self.offset, 0))
+            self.deferred = None
+
+        if not final:
+            ordered_end = len(data) - self.buffer_size + 1
+            if end > ordered_end:
+                self.deferred = max(start, ordered_end) + self.offset
+                end = ordered_end
+
+        for pos in range(start, end):
+            self.insert(data, pos)
+
+
+    def find(self, data, pos, max_length):
+        """
+        Find the longest match for the data at the given position in the
+        sliding window preceding it.
+
+        Params:
+            data: the input message
+            pos: current position in data
+            max_length: upper bound on the length of the match
+
+        Returns:
+            A pair (distance, length), where "distance" is how many bytes
+            backwards the match was found. If there is no match, (0, 0) is
+            returned.
+        """
+
+        if self.deferred is not None and self.deferred - self.offset < pos:
+            # Insert the positions held back that can now be placed
+            self.insert_range(data, pos, pos, False)
+
+        window_start = max(pos - self.window_size, 0)
+        best_length = 0
+        best_pos = -1
+
+        if max_length >= MIN_MATCH and pos + MIN_MATCH <= len(data):
+            key = data[pos] << 16 | data[pos + 1] << 8 | data[pos + 2]
+            left = self.left
+            right = self.right
+            cycle = self.window_size + 1
+            offset = self.offset
+            chain = self.max_chain
+            overlap = self.overlap
+            # Compared as far as insert does, to follow the order of the tree
+            limit = min(self.buffer_size, len(data) - pos)
+
+            far_left = FAR_SEARCH
+
+            # Subtrees left to search, with how far the positions on either
+            # side of them match, and whether they are off the path to the
+            # current data
+            subtrees = [(self.head.get(key, -1) - offset, 0, 0, False)]
+
+            while subtrees and best_length < max_length:
+                candidate, left_length, right_length, far = subtrees.pop()
+                if candidate < window_start:
+                    continue
+
+                if far:
+                    if far_left <= 0:
+                        continue
+                    far_left -= 1
+
+                length = min(left_length, right_length)
+                if length < limit and data[candidate + length] == data[pos + length]:
+                    length += match_length(data, candidate + length, pos + length,
+                                           limit - length)
+
+                distance = pos - candidate
+                matched = min(length, max_length)
+
+                if overlap:
+                    usable = matched
+                elif matched > distance:
+                    # The match runs into the lookahead buffer, so the data
+                    # repeats with period "distance"; a whole number of
+                    # periods further back may give a longer usable match.
+                    repeat = pos - -(-matched // distance) * distance
+                    if repeat >= window_start:
+                        repeat_length = match_length(data, repeat, pos, matched)
+                        if repeat_length > best_length:
+                            best_length = repeat_length
+                            best_pos = repeat
+
+                    usable = distance
+                else:
+                    usable = matched
+
+                if usable > best_length:
+                    best_length = usable
+                    best_pos = candidate
+
+                if chain is not None:
+                    chain -= 1
+                    if chain <= 0:
+                        break
+
+                slot = (candidate + offset) % cycle
+
+                # The positions greater than this one are to its right, and
+                # the ones matching as far as the tree is ordered are kept
+                # there too when overlap is off
+                greater = (right[slot] - offset, length, right_length, far)
+                smaller = (left[slot] - offset, left_length, length, far)
+
+                if length == limit or data[candidate + length] < data[pos + length]:
+                    nearer, further = greater, smaller
+                else:
+                    nearer, further = smaller, greater
+
+                if (length == limit or usable < matched) and far_left > 0:
+                    # Positions on the far side may match as well as this
+                    # one, which ran into the lookahead, but further back.
+                    # Only FAR_SEARCH of them are visited, so that on
+                    # repetitive data the search does not cover the tree.
+                    subtrees.append(further[:3] + (True,))
+                subtrees.append(nearer)
+
+        if best_length >= MIN_MATCH:
+            return pos - best_pos, best_length
+
+        return find_short_match(data, pos, window_start, max_length, self.overlap)
+
+
+class MatchIndex():
+    """
+    Index of the longest match at every position of a whole message, for
+    any window size up to max_window, built with a single pass of hash
+    chains over the message.
+
+    As the window grows, the longest match at a position can only grow, at
+    the distances where a longer match is first found. The index keeps
+    those (distance, length) steps for every position, so the longest match
+    in a window of any size is a lookup rather than a search. This is what
+    lets a whole grid of window and buffer sizes be coded from one index;
+    see Lz77Encoder.compressed_size.
+
+    As every position is searched across the largest window, there are
+    chains for prefixes of each of INDEX_KEY_LENGTHS, and a search moves on
+    to the chain of the longest prefix that a longer match must share, which
+    skips most of the candidates that cannot beat the best match so far.
+
+    Matches do not overlap the position and are cut to max_length, so that
+    they are those HashChainMatchFinder finds with no max_chain.
+    """
+
+    def __init__(self, data, max_window, max_length):
+        self.max_window = max_window
+        self.max_length = max_length
+        self.starts = [0]
+        self.distances = []
+        self.lengths = []
+
+        data = bytes(data)
+        data_len = len(data)
+        heads = [{} for _ in INDEX_KEY_LENGTHS]
+        prevs = [[-1] * data_len for _ in INDEX_KEY_LENGTHS]
+        last_byte = [-1] * 256
+        last_pair = {}
+        starts = self.starts
+        distances = self.distances
+        lengths = self.lengths
+
+        for pos in range(data_len):
+            # The pair ending at pos and the prefixes starting just before it
+            # become candidates
+            if pos >= 2:
+                last_pair[data[pos - 2:pos]] = pos - 2
+            for level, key_length in enumerate(INDEX_KEY_LENGTHS):
+                if pos - 1 + key_length > data_len or pos < 1:
+                    break
+                key = data[pos - 1:pos - 1 + key_length]
+                prevs[level][pos - 1] = heads[level].get(key, -1)
+                heads[level][key] = pos - 1
+
+            limit = min(max_length, data_len - pos)
+            best_length = 0
+
+            # Any match of 2 bytes is also one of 1 byte at the same
+            # distance or further, and any match of 3 bytes at a distance of
+            # 3 or more is also one of 2 bytes, so the steps come in order
+            candidate = last_byte[data[pos]]
+            if limit >= 1 and candidate >= 0 and pos - candidate <= max_window:
+                distances.append(pos - candidate)
+                lengths.append(1)
+                best_length = 1
+
+            if limit >= 2 and pos + 2 <= data_len:
+                candidate = last_pair.get(data[pos:pos + 2], -1)
+                if candidate >= 0 and pos - candidate <= max_window:
+                    if best_length and distances[-1] == pos - candidate:
+                        lengths[-1] = 2
+                    else:
+                        distances.append(pos - candidate)
+                        lengths.append(2)
+                    best_length = 2
+
+            if limit >= MIN_MATCH and pos + MIN_MATCH <= data_len:
+                window_start = max(pos - max_window, 0)
+                level = 0
+                prev = prevs[0]
+                candidate = heads[0].get(data[pos:pos + MIN_MATCH], -1)
+                # Candidates at this distance or closer have been tried
+                reached = MIN_MATCH - 1
+
+                while candidate >= window_start and best_length < limit:
+                    distance = pos - candidate
+
+                    if distance > reached:
+                        reached = distance
+
+                        if (distance > best_length
+                                and data[candidate + best_length] == data[pos + best_length]):
+                            length = match_length(data, candidate, pos, min(limit, distance))
+
+                            if length > best_length:
+                                best_length = length
+                                distances.append(distance)
+                                lengths.append(length)
+
+                                key_length = INDEX_KEY_LENGTHS[level]
+                                while (level + 1 < len(INDEX_KEY_LENGTHS)
+                                       and INDEX_KEY_LENGTHS[level + 1] <= best_length + 1
+                                       and pos + INDEX_KEY_LENGTHS[level + 1] <= data_len):
+                                    level += 1
+
+                                if INDEX_KEY_LENGTHS[level] != key_length:
+                                    prev = prevs[level]
+                                    key_length = INDEX_KEY_LENGTHS[level]
+                                    candidate = heads[level].get(data[pos:pos + key_length], -1)
+                                    continue
+
+                    candidate = prev[candidate]
+
+            last_byte[data[pos]] = pos
+            starts.append(len(distances))
+
+
+    def longest(self, pos, window_size):
+        """
+        Length of the longest match for the data at the given position
+        within a window of the given size, before any limit smaller than
+        max_length.
+        """
+
+        length = 0
+        distances = self.distances
+
+        for step in range(self.starts[pos], self.starts[pos + 1]):
+            if distances[step] > window_size:
+                break
+            length = self.lengths[step]
+
+        return length
+
+
+MATCH_FINDERS = ('hash_chain', 'binary_tree')
+
+
+def make_match_finder(name, window_size, buffer_size, max_chain=None, overlap=False):
+    """
+    Create a match finder by name.
+
+    Params:
+        name: 'hash_chain' or 'binary_tree'
+        window_size: size of the sliding window
+        buffer_size: size of the lookahead buffer
+        max_chain: maximum number of candidate positions to visit per search,
+                   or None for no limit
+        overlap: whether matches may run on into the lookahead buffer
+    """
+
+    if name == 'hash_chain':
+        return HashChainMatchFinder(window_size, max_chain, overlap)
+    if name == 'binary_tree':
+        return BinaryTreeMatchFinder(window_size, buffer_size, max_chain, overlap)
+
+    raise ValueError(f'Unknown match finder: {name}')
+
+
+def find_short_match(data, pos, window_start, max_length, overlap=False):
+    """
+    Find the closest match of length 2 or 1 for the data at the given
+    position, searching data[window_start:pos], or up to the end of the
+    match if it may overlap the position.
+
+    Returns:
+        A pair (distance, length), or (0, 0) if there is no match.
+    """
+
+    for length in range(min(max_length, MIN_MATCH - 1), 0, -1):
+        if pos + length > len(data):
+            continue
+
+        end = pos + length - 1 if overlap else pos
+        match_pos = data.rfind(data[pos:pos + length], window_start, end)
+        if match_pos >= 0:
+            return pos - match_pos, length
+
+    return 0, 0
+
+
+def match_length(data, first, second, limit):
+    """
+    Count how many bytes starting at the two positions are equal, up to
+    "limit" bytes.
+    """
+
+    length = 0
+    step = 16
+
+    # Compare growing blocks, then narrow down on the block that differs
+    while length < limit:
+        size = min(step, limit - length)
+        if data[first + length:first + length + size] != data[second + length:second + length + size]:
+            break
+        length += size
+        step <<= 1
+    else:
+        return limit
+
+    while size > 8:
+        size >>= 1
+        if data[first + length:first + length + size] == data[second + length:second + length + size]:
+            length += size
+
+    while data[first + length] == data[second + length]:
+        length += 1
+
+    return length
@@ -0,0 +1,452 @@
+""" Digital Communication - Lempel-Ziv plots """
+
+import argparse
+import os
+from mpl_toolkits.mplot3d import Axes3D
+import matplotlib.pyplot as plt
+from matplotlib import cm
+from matplotlib.ticker import LinearLocator, FormatStrFormatter
+import numpy as np
+
+from lempelziv import LempelZiv
+from sweep import run_sweep, time_task
+
+
+# Analyses the plot command can run, in the order it runs them
+ANALYSES = ('time', 'params', 'types', 'ratio')
+
+
+class LempelZivPlots(LempelZiv):
+    """ LZ77 analyses that plot their results and save them in plots/ """
+
+    def plot_encoder_time_complexity(self, encoding_times, files, file_sizes, gzip_times, bzip2_times):
+        labels = ['Average (LZ77)', 'Maximum (LZ77)', 'Minimum (LZ77)']
+
+        colors = ['b', 'r', 'g']
+
+        plot_title = f'Encoder running time (window size = {self.window_size} bytes, buffer size = {self.buffer_size} bytes)'
+        plot_filename = 'plots/encoder_running_time.png'
+
+        plt.cla()
+
+        for times, label, color in zip(encoding_times, labels, colors):
+            x_values = []
+            encoding_y_values = []
+
+            for filename in files:
+                x_values.append(file_sizes[filename])
+                encoding_y_values.append(times[filename])
+
+            plt.plot(x_values, encoding_y_values, color + 'x-', label=label)
+
+        if gzip_times or bzip2_times:
+            plot_title = 'Encoding running time comparison'
+            plot_filename = 'plots/compare_encoding_running_time.png'
+
+        if gzip_times:
+            x_values = []
+            encoding_y_values = []
+
+            for filename in files:
+                x_values.append(file_sizes[filename])
+                encoding_y_values.append(gzip_times[0][filename])
+
+            plt.plot(x_values, encoding_y_values, 'yx-', label='Average (gzip)')
+
+        if bzip2_times:
+            x_values = []
+            encoding_y_values = []
+
+            for filename in files:
+                x_values.append(file_sizes[filename])
+                encoding_y_values.append(bzip2_times[0][filename])
+
+            plt.plot(x_values, encoding_y_values, 'cx-', label='Average (bzip2)')
+
+        plt.title(plot_title)
+        plt.xlabel('File size (KB)')
+        plt.ylabel('Running time (s)')
+        plt.legend()
+        plt.savefig(plot_filename)
+        plt.cla()
+
+
+    def plot_decoder_time_complexity(self, decoding_times, files, file_sizes, gzip_times, bzip2_times):
+        labels = ['Average (LZ77)', 'Maximum (LZ77)', 'Minimum (LZ77)']
+
+        colors = ['b', 'r', 'g']
+
+        plot_title = f'Decoder running time (window size = {self.window_size} bytes, buffer size = {self.buffer_size} bytes)'
+        plot_filename = 'plots/decoder_running_time.png'
+
+        plt.cla()
+
+        for times, label, color in zip(decoding_times, labels, colors):
+            x_values = []
+            decoding_y_values = []
+
+            for filename in files:
+                x_values.append(file_sizes[filename])
+                decoding_y_values.append(times[filename])
+
+            plt.plot(x_values, decoding_y_values, color + 'x-', label=label)
+
+        if gzip_times or bzip2_times:
+            plot_title = 'Decoding running time comparison'
+            plot_filename = 'plots/compare_decoding_running_time.png'
+
+        if gzip_times:
+            x_values = []
+            encoding_y_values = []
+
+            for filename in files:
+                x_values.append(file_sizes[filename])
+                encoding_y_values.append(gzip_times[0][filename])
+
+            plt.plot(x_values, encoding_y_values, 'yx-', label='Average (gzip)')
+
+        if bzip2_times:
+            x_values = []
+            encoding_y_values = []
+
+            for filename in files:
+                x_values.append(file_sizes[filename])
+                encoding_y_values.append(bzip2_times[0][filename])
+
+            plt.plot(x_values, encoding_y_values, 'cx-', label='Average (bzip2)')
+
+        plt.title(plot_title)
+        plt.xlabel('File size (KB)')
+        plt.ylabel('Running time (s)')
+        plt.legend()
+        plt.savefig(plot_filename)
+        plt.cla()
+
+
+    def analyse_time_complexity(self, input_dir, rounds, compare=False):
+        """
+        Perform a running time analysis on the encoder and decoder, plot and
+        save results.
+
+        Params:
+            input_dir: directory containing files to benchmark with
+            rounds: number of times to run benchmark on each file to get average
+                    times
+        """
+
+        files = [f'{input_dir}/{filename}' for filename in os.listdir(input_dir)]
+        files.sort(key=os.path.getsize)
+
+        file_sizes = {filename: os.path.getsize(filename) / 1000
+                      for filename in files}
+
+        encoding_times, decoding_times = self.get_time_complexity_results(files, rounds)
+        gzip_encoding_times = gzip_decoding_times = []
+        bzip2_encoding_times = bzip2_decoding_times = []
+
+        self.plot_encoder_time_complexity(encoding_times, files, file_sizes, gzip_encoding_times, bzip2_encoding_times)
+        self.plot_decoder_time_complexity(decoding_times, files, file_sizes, gzip_decoding_times, bzip2_decoding_times)
+
+        if compare:
+            gzip_encoding_times, gzip_decoding_times = self.get_time_complexity_results(files, rounds, alg='gzip')
+            bzip2_encoding_times, bzip2_decoding_times = self.get_time_complexity_results(files, rounds, alg='bzip2')
+
+        self.plot_encoder_time_complexity(encoding_times, files, file_sizes, gzip_encoding_times, bzip2_encoding_times)
+        self.plot_decoder_time_complexity(decoding_times, files, file_sizes, gzip_decoding_times, bzip2_decoding_times)
+
+
+    def analyse_time_params(self, filename, rounds, workers=None, checkpoint=None):
+        """
+        Perform a running time analysis on the encoder and decoder with
+        varying window sizes, then varying lookahead buffer sizes, plot and
+        save results.
+
+        The sizes are benchmarked on a pool of worker processes; see
+        sweep.run_sweep. Runs sharing the CPUs slow each other down, so
+        fewer workers than CPUs give steadier timings.
+
+        Params:
+            filename: file to perform benchmark on
+            rounds: number of times to run benchmark for each size
+            workers: number of worker processes, or None for one per CPU
+            checkpoint: name of a file to keep the results in, so that an
+                        interrupted analysis can be resumed
+        """
+
+        window_sizes = self._calc_window_sizes(filename)
+        # buffer_sizes = self._calc_buffer_sizes(filename)
+        buffer_sizes = [50, 100, 200, 300, 600, 900, 1200]
+
+        window_points = [(filename, w_size, self.lz77_encoder.buffer_size, rounds)
+                         for w_size in window_sizes]
+        buffer_points = [(filename, self.lz77_encoder.window_size, b_size, rounds)
+                         for b_size in buffer_sizes]
+
+        benchmarks = run_sweep(time_task, window_points + buffer_points, workers, checkpoint)
+
+        avg_encoding_times = []
+        max_encoding_times = []
+        min_encoding_times = []
+
+        avg_decoding_times = []
+        max_decoding_times = []
+        min_decoding_times = []
+
+        x_values = np.array(window_sizes) / 1000
+
+        for encoding_benchmark, decoding_benchmark in benchmarks[:len(window_sizes)]:
+            avg_encoding_times.append(encoding_benchmark['avg'])
+            min_encoding_times.append(encoding_benchmark['min'])
+            max_encoding_times.append(encoding_benchmark['max'])
+
+            avg_decoding_times.append(decoding_benchmark['avg'])
+            min_decoding_times.append(decoding_benchmark['min'])
+            max_decoding_times.append(decoding_benchmark['max'])
+
+        plt.cla()
+
+        plt.plot(x_values, avg_encoding_times, color='b', label='Average')
+        plt.plot(x_values, max_encoding_times, color='r', label='Maximum')
+        plt.plot(x_values, min_encoding_times, color='g', label='Minimum')
+
+        plt.title(f'Encoder running time (buffer size = {self.lz77_encoder.buffer_size} bytes, input size = {os.path.getsize(filename)} bytes)')
+        plt.xlabel('Window size (KB)')
+        plt.ylabel('Running time (s)')
+        plt.legend()
+        plt.savefig('plots/encoder_time_window_sizes.png')
+        plt.cla()
+
+        plt.plot(x_values, avg_decoding_times, color='b', label='Average')
+        plt.plot(x_values, max_decoding_times, color='r', label='Maximum')
+        plt.plot(x_values, min_decoding_times, color='g', label='Minimum')
+
+        plt.title(f'Decoder running time (buffer size = {self.lz77_encoder.buffer_size} bytes, input size = {os.path.getsize(filename)} bytes)')
+        plt.xlabel('Window size (KB)')
+        plt.ylabel('Running time (s)')
+        plt.legend()
+        plt.savefig('plots/decoder_time_window_sizes.png')
+        plt.cla()
+
+        avg_encoding_times = []
+        max_encoding_times = []
+        min_encoding_times = []
+
+        avg_decoding_times = []
+        max_decoding_times = []
+        min_decoding_times = []
+
+        x_values = np.array(buffer_sizes)
+
+        for encoding_benchmark, decoding_benchmark in benchmarks[len(window_sizes):]:
+            avg_encoding_times.append(encoding_benchmark['avg'])
+            min_encoding_times.append(encoding_benchmark['min'])
+            max_encoding_times.append(encoding_benchmark['max'])
+
+            avg_decoding_times.append(decoding_benchmark['avg'])
+            min_decoding_times.append(decoding_benchmark['min'])
+            max_decoding_times.append(decoding_benchmark['max'])
+
+        plt.cla()
+
+        plt.plot(x_values, avg_encoding_times, color='b', label='Average')
+        plt.plot(x_values, max_encoding_times, color='r', label='Maximum')
+        plt.plot(x_values, min_encoding_times, color='g', label='Minimum')
+
+        plt.title(f'Encoder running time (W = {self.lz77_encoder.window_size}, Input size = {os.path.getsize(filename)}B)')
+        plt.xlabel('Lookahead buffer size (KB)')
+        plt.ylabel('Running time (s)')
+        plt.legend()
+        plt.savefig('plots/encoder_time_buffer_sizes.png')
+        plt.cla()
+
+        plt.plot(x_values, avg_decoding_times, color='b', label='Average')
+        plt.plot(x_values, max_decoding_times, color='r', label='Maximum')
+        plt.plot(x_values, min_decoding_times, color='g', label='Minimum')
+
+        plt.title(f'Decoder running time (window size = {self.lz77_encoder.window_size} bytes, input size = {os.path.getsize(filename)} bytes)')
+        plt.xlabel('Buffer size (B)')
+        plt.ylabel('Running time (s)')
+        plt.legend()
+        plt.savefig('plots/decoder_time_buffer_sizes.png')
+
+
+    def analyse_compression_ratio(self, filename):
+        """
+        Perform a compression ratio analysis on the encoder with varying window
+        and lookahead buffer sizes, plot and save results.
+
+        Params:
+            filename: file to perform benchmark on
+        """
+
+        window_sizes = self._calc_window_sizes(filename)
+        # buffer_sizes = self._calc_buffer_sizes(filename)
+        buffer_sizes = [50, 100, 200, 300, 600, 900, 1200]
+
+        benchmarks = self.benchmark_ratio(filename, window_sizes, buffer_sizes, indexed=True)
+
+        x_values, y_values = np.meshgrid(np.array(window_sizes) / 1000,
+                                         np.array(buffer_sizes))
+        z_values = np.array(benchmarks).transpose()
+
+        plt.cla()
+
+        fig = plt.figure()
+        axes = fig.gca(projection='3d')
+
+        surf = axes.plot_surface(x_values, y_values, z_values, cmap=cm.coolwarm,
+                                 linewidth=0)
+
+        axes.zaxis.set_major_locator(LinearLocator(10))
+        axes.zaxis.set_major_formatter(FormatStrFormatter('%.02f'))
+        axes.set_title(f'Compression Ratio (input = {os.path.getsize(filename)} bytes)')
+        axes.set_xlabel('Window size (KB)')
+        axes.set_ylabel('Lookahead buffer size (B)')
+        axes.set_zlabel('Compression ratio')
+
+        fig.colorbar(surf, shrink=0.5, aspect=5)
+
+        axes.view_init(30, 50)
+
+        plt.savefig('plots/compression_ratio.png')
+
+        axes.clear()
+
+
+    def analyse_file_types(self, compare=False):
+        original_window_size = self.lz77_encoder.window_size
+
+        main_dir = 'file_types'
+
+        x_values = []
+        ratios = []
+        gzip_ratios = []
+        bzip2_ratios = []
+        mpl_colors = ['lightsalmon', 'red', 'darkred', 'pink', 'deeppink', 'orange',
+                      'gold', 'lemonchiffon', 'darkkhaki', 'plum', 'magenta',
+                      'mediumpurple', 'purple', 'indigo', 'lime', 'seagreen',
+                      'aqua', 'black']
+        colors = []
+
+        i = 0
+        for ext in os.listdir(main_dir):
+            files = [f'{main_dir}/{ext}/{filename}'
+                     for filename in os.listdir(f'{main_dir}/{ext}')]
+            files.sort(key=os.path.getsize)
+
+            for filename in files:
+                uncompressed_size = os.path.getsize(filename)
+                window_size = min(150 * (uncompressed_size // 1000), 15000)
+
+                x_values.append(f'{round(uncompressed_size / 1000, 1)} KB {ext}')
+                colors.append(mpl_colors[i % len(mpl_colors)])
+
+                print(f'{filename}: window size = {window_size}')
+
+                self.lz77_encoder.set_window_size(window_size)
+                self.lz77_decoder.set_window_size(window_size)
+
+                self.compress_lz77(filename)
+
+                compressed_size = os.path.getsize(filename + self.lz77_encoder.file_ext)
+                ratio = uncompressed_size / compressed_size
+                print('Ratio: ', round(ratio, 2))
+
+                self.decompress_lz77(filename + self.lz77_encoder.file_ext)
+
+                ratios.append(ratio)
+
+                if compare:
+                    self.compress_gzip(filename)
+
+                    compressed_size = os.path.getsize(filename + '.gz')
+                    ratio = uncompressed_size / compressed_size
+                    print('Ratio (gzip): ', round(ratio, 2))
+
+                    self.decompress_gzip(filename + '.gz')
+
+                    gzip_ratios.append(ratio)
+
+                    self.compress_bzip2(filename)
+
+                    compressed_size = os.path.getsize(filename + '.bz2')
+                    ratio = uncompressed_size / compressed_size
+                    print('Ratio (bzip2): ', round(ratio, 2))
+
+                    self.decompress_bzip2(filename + '.bz2')
+
+                    bzip2_ratios.append(ratio)
+
+            i += 1
+
+        self.lz77_encoder.set_window_size(original_window_size)
+        self.lz77_decoder.set_window_size(original_window_size)
+
+        x_pos = [i for i in range(len(x_values))]
+
+        plt.cla()
+        fig = plt.figure(figsize=(12, 7))
+        fig.subplots_adjust(bottom=0.2)
+        plt.tight_layout()
+        plt.bar(x_pos, ratios, color=colors)
+        plt.xlabel('File')
+        plt.ylabel('Compression ratio')
+        plt.title('Compression ratio for various file types')
+        plt.xticks(x_pos, x_values, rotation=90, fontsize='small')
+        plt.savefig('plots/file_types.png')
+        plt.cla()
+
+        if compare:
+            plt.bar(x_pos, ratios, 0.3, color='b', label='LZ77')
+            plt.bar(np.array(x_pos) + 0.3, gzip_ratios, 0.3, color='r', label='gzip')
+            plt.bar(np.array(x_pos) + 0.6, bzip2_ratios, 0.3, color='g', label='bzip2')
+            plt.xlabel('File')
+            plt.ylabel('Compression ratio')
+            plt.title('Compression ratio for various file types by compression algorithm')
+            plt.xticks(np.array(x_pos) + 0.45, x_values, rotation=90, fontsize='small')
+            plt.legend(loc='best')
+            plt.savefig('plots/ratio_comparison.png')
+
+
+def add_arguments(parser):
+    """ Add the plot command's arguments to an argparse parser """
+    parser.add_argument('analyses', nargs='*', type=_analysis, metavar='analysis',
+                        help=f'analyses to run out of {", ".join(ANALYSES)}, all of them '
+                             'by default')
+    parser.add_argument('--window-size', type=int, default=10000)
+    parser.add_argument('--buffer-size', type=int, default=100)
+    parser.add_argument('--file', default='misc/alice29.txt',
+                        help='file for the parameter and compression ratio analyses')
+    parser.add_argument('--input-dir', default='lorem',
+                        help='directory of files of growing sizes for the time analysis')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--compare', action='store_true',
+                        help='compare with gzip and bzip2')
+    parser.add_argument('--workers', type=int,
+                        help='number of worker processes for the parameter analysis')
+    parser.add_argument('--checkpoint',
+                        help='file to keep the parameter analysis results in')
+
+
+def run(args):
+    """ Run the analyses the command line arguments name, saving their plots """
+    analyses = args.analyses or ANALYSES
+    lz = LempelZivPlots(args.window_size, args.buffer_size)
+
+    if 'time' in analyses:
+        lz.analyse_time_complexity(args.input_dir, args.rounds, compare=args.compare)
+    if 'params' in analyses:
+        lz.analyse_time_params(args.file, args.rounds, args.workers, args.checkpoint)
+    if 'types' in analyses:
+        lz.analyse_file_types(compare=args.compare)
+    if 'ratio' in analyses:
+        lz.analyse_compression_ratio(args.file)
+
+
+def _analysis(name):
+    # Checked here rather than with "choices", which argparse also applies
+    # to the empty default of an optional positional argument
+    if name not in ANALYSES:
+        raise argparse.ArgumentTypeError(f'invalid analysis: {name} (choose from '
+                                         f'{", ".join(ANALYSES)})')
+    return name
@@ -0,0 +1,74 @@
+""" Digital Communication - Lempel-Ziv sliding window """
+
+
+MIN_BLOCK_SIZE = 1 << 16
+
+
+class SlidingWindow():
+    """
+    Byte-level sliding window and lookahead buffer over an input message.
+
+    The window and buffer live in a single bytearray, "data", indexed by
+    "pos" for the start of the lookahead buffer. When reading from a stream,
+    new input is appended a block at a time and the bytes that have fallen
+    out of the window are dropped from the front once per block, so at most
+    about 2 * (window_size + lookahead_size) bytes are held at any time.
+
+    "lookahead_size" is how many bytes past "pos" must be available before
+    coding the next position, unless the input has ended.
+
+    If "fed" is set, there is no stream, and input is instead given to
+    append() as it arrives until close() is called.
+    """
+
+    def __init__(self, window_size, lookahead_size, stream=None, data=b'', fed=False):
+        self.window_size = window_size
+        self.lookahead_size = lookahead_size
+        self.block_size = max(window_size + lookahead_size, MIN_BLOCK_SIZE)
+        self.stream = stream
+        self.data = bytearray(data) if stream is not None or fed else data
+        self.pos = 0
+        self.offset = 0
+        self.eof = stream is None and not fed
+
+
+    def needs_fill(self):
+        """ Check whether the lookahead buffer is short of input """
+        return not self.eof and len(self.data) - self.pos < self.lookahead_size
+
+
+    def fill(self):
+        """
+        Drop the bytes that have left the sliding window and read the next
+        block of input.
+
+        Returns:
+            The number of bytes dropped from the front of data. Positions
+            into data move back by this amount.
+        """
+
+        dropped = max(self.pos - self.window_size, 0)
+
+        if dropped:
+            del self.data[:dropped]
+            self.pos -= dropped
+            self.offset += dropped
+
+        while (self.stream is not None and not self.eof
+               and len(self.data) - self.pos < self.block_size):
+            block = self.stream.read(self.block_size)
+            if not block:
+                self.eof = True
+            self.data += block
+
+        return dropped
+
+
+    def append(self, data):
+        """ Add input to the end of a fed window """
+        self.data += data
+
+
+    def close(self):
+        """ Mark the end of the input of a fed window """
+        self.eof = True
@@ -0,0 +1,221 @@
+""" Digital Communication - Lempel-Ziv coding statistics """
+
+import time
+from collections import Counter
+
+
+# Codes taken from a code generator at a time while counting them
+CODE_BATCH = 1 << 10
+
+
+class CodingStats():
+    """
+    Statistics of one compression or decompression, collected by
+    Lz77Encoder and Lz77Decoder when collect_stats is set: the time spent
+    in each phase, the codes and the bytes read and written.
+
+    The time of a phase does not include the time of the phases nested in
+    it: reading the input while searching for matches counts as 'io', not
+    as 'search'. The time not taken by any timed phase is put down to the
+    phase given as "rest" to finish.
+
+    Codes are counted as they are taken from the code generator, so codes
+    made in worker processes are not counted. Literals are counted in bytes,
+    so stored data counts as literals. The bytes read include any read
+    twice, such as the sample the encoder checks for compressed data.
+    """
+
+    def __init__(self):
+        self.timers = Counter()
+        self.codes = 0
+        self.matches = 0
+        self.literals = 0
+        self.matched_bytes = 0
+        self.length_histogram = Counter()
+        self.distance_histogram = Counter()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.total_time = 0
+        # Time of the timed sections so far, for taking the nested sections
+        # out of the time of the ones around them
+        self.claimed = 0
+
+
+    def timed_call(self, phase, function, *args):
+        """ Call a function, adding the time it takes to a phase """
+        claimed = self.claimed
+        start = time.perf_counter_ns()
+        result = function(*args)
+        elapsed = time.perf_counter_ns() - start
+
+        self.timers[phase] += elapsed - (self.claimed - claimed)
+        self.claimed = claimed + elapsed
+
+        return result
+
+
+    def timed(self, phase, function):
+        """ Wrap a function so that the time it takes is added to a phase """
+        return lambda *args: self.timed_call(phase, function, *args)
+
+
+    def count_codes(self, codes, phase):
+        """
+        Wrap a generator of LZ77 codes, counting the codes and adding the
+        time taken to make them to a phase. The codes are taken from the
+        generator CODE_BATCH at a time, so that timing them costs little,
+        but a stored block is always taken on its own.
+
+        Params:
+            codes: iterable of triples (distance, length, next_sym)
+            phase: name of the phase making the codes
+
+        Returns:
+            Generator of the same codes.
+        """
+
+        codes = iter(codes)
+
+        while True:
+            batch = self.timed_call(phase, _take_batch, codes)
+            if not batch:
+                return
+
+            # Counting takes a phase of its own, so that it does not skew
+            # the others
+            self.timed_call('stats', self._count, batch)
+
+            yield from batch
+
+
+    def _count(self, codes):
+        lengths = self.length_histogram
+        distances = self.distance_histogram
+
+        for code in codes:
+            if code is None:
+                continue
+
+            distance, length, next_sym = code
+            self.codes += 1
+            self.literals += len(next_sym)
+
+            if length:
+                self.matches += 1
+                self.matched_bytes += length
+                lengths[length] += 1
+                distances[distance] += 1
+
+
+    def start(self):
+        """ Start timing the whole run """
+        self.total_time = time.perf_counter_ns()
+
+
+    def finish(self, rest):
+        """
+        Stop timing the whole run, and put the time not taken by any timed
+        phase down to the phase "rest".
+        """
+
+        self.total_time = time.perf_counter_ns() - self.total_time
+        self.timers[rest] += self.total_time - self.claimed
+
+
+    def literal_ratio(self):
+        """ Fraction of the message's bytes that were coded as literals """
+        coded = self.literals + self.matched_bytes
+        return self.literals / coded if coded else 0.0
+
+
+    def report(self):
+        """
+        Report of the statistics as lines of text, with the histograms
+        grouped into powers of two.
+        """
+
+        total = self.total_time or 1
+        lines = [f'Total time:        {self.total_time / 1e9:.3f} seconds']
+
+        for phase, elapsed in self.timers.most_common():
+            lines.append(f'  {phase + ":":16} {elapsed / 1e9:.3f} seconds ({100 * elapsed / total:.1f}%)')
+
+        lines += [f'Bytes read:        {self.bytes_read}',
+                  f'Bytes written:     {self.bytes_written}',
+                  f'Codes:             {self.codes}',
+                  f'Matches:           {self.matches} ({self.matched_bytes} bytes)',
+                  f'Literals:          {self.literals} bytes',
+                  f'Literal ratio:     {self.literal_ratio():.3f}']
+
+        for name, histogram in (('Match lengths', self.length_histogram),
+                                ('Match distances', self.distance_histogram)):
+            lines.append(f'{name}:')
+            for low, high, count in power_histogram(histogram):
+                value_range = f'{low}' if low == high else f'{low}-{high}'
+                lines.append(f'  {value_range:>16}: {count}')
+
+        return '\n'.join(lines)
+
+
+class TimedFile():
+    """
+    Wrapper around a file adding the time spent reading and writing it to
+    the 'io' phase of a CodingStats, and counting the bytes read and written.
+    """
+
+    def __init__(self, stream, stats):
+        self.stream = stream
+        self.stats = stats
+
+
+    def read(self, size=-1):
+        """ Read from the wrapped file """
+        data = self.stats.timed_call('io', self.stream.read, size)
+        self.stats.bytes_read += len(data)
+        return data
+
+
+    def write(self, data):
+        """ Write to the wrapped file """
+        written = self.stats.timed_call('io', self.stream.write, data)
+        self.stats.bytes_written += len(data)
+        return written
+
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def power_histogram(histogram):
+    """
+    Group a histogram of positive integers into powers of two.
+
+    Returns:
+        List of triples (lowest value, highest value, count) for each power
+        of two from the lowest to the highest value found.
+    """
+
+    groups = Counter()
+    for value, count in histogram.items():
+        groups[value.bit_length()] += count
+
+    if not groups:
+        return []
+
+    return [(1 << bits >> 1, (1 << bits) - 1, groups[bits])
+            for bits in range(min(groups), max(groups) + 1)]
+
+
+def _take_batch(codes):
+    # A code with a symbol of more than a byte holds a stored block, which
+    # may be large, so it ends the batch: as when not counting, no more than
+    # one of them is held at a time
+    batch = []
+
+    for code in codes:
+        batch.append(code)
+
+        if len(batch) >= CODE_BATCH or code is not None and len(code[2]) > 1:
+            break
+
+    return batch
@@ -0,0 +1,200 @@
+""" Digital Communication - Lempel-Ziv asyncio streams """
+
+import asyncio
+
+from decoder import Lz77Decompressor
+from encoder import FLUSH_SIZE, Lz77Compressor
+
+
+class Lz77StreamWriter():
+    """
+    Wrapper around an asyncio.StreamWriter that compresses the data written
+    to it with an Lz77Compressor.
+
+    Like asyncio.StreamWriter, write() only buffers the data, and drain()
+    must be awaited to let it through. Once high_water bytes are buffered,
+    drain() codes them in an executor, by default the event loop's thread
+    pool, so the event loop is never blocked by the coding. It then waits
+    for the underlying writer as well, so a slow peer holds back the task
+    writing to it.
+
+    Params:
+        writer: the asyncio.StreamWriter to write the compressed data to
+        window_size: size of the sliding window
+        buffer_size: size of the lookahead buffer
+        executor: concurrent.futures executor to code in, or None for the
+                  default one
+        high_water: number of bytes buffered before drain() codes them
+        options: further arguments to Lz77Compressor
+    """
+
+    def __init__(self, writer, window_size, buffer_size, executor=None,
+                 high_water=FLUSH_SIZE, **options):
+        self.writer = writer
+        self.compressor = Lz77Compressor(window_size, buffer_size, **options)
+        self.executor = executor
+        self.high_water = high_water
+        self.pending = bytearray()
+        self.lock = asyncio.Lock()
+
+
+    def write(self, data):
+        """ Buffer data to be compressed """
+        self.pending += data
+
+
+    async def drain(self):
+        """
+        Compress the buffered data if there is enough of it, and wait until
+        the underlying writer can take more.
+        """
+
+        if len(self.pending) >= self.high_water:
+            await self._code(self.compressor.compress, self._take_pending())
+        else:
+            await self.writer.drain()
+
+
+    async def flush(self):
+        """
+        Compress all the data written so far and send it on, so that the
+        peer can decode all of it.
+        """
+
+        await self._code(self._flush, self._take_pending(), False)
+
+
+    async def finish(self):
+        """
+        End the compressed stream, leaving the underlying writer open. No
+        more data can be written after this.
+        """
+
+        await self._code(self._flush, self._take_pending(), True)
+
+
+    async def close(self):
+        """ End the compressed stream and close the underlying writer """
+        await self.finish()
+
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+    def _take_pending(self):
+        data = self.pending
+        self.pending = bytearray()
+        return data
+
+
+    def _flush(self, data, finish):
+        return self.compressor.compress(data) + self.compressor.flush(finish)
+
+
+    async def _code(self, method, *args):
+        # The compressor keeps state between calls, so calls from several
+        # tasks are run one at a time
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            output = await loop.run_in_executor(self.executor, method, *args)
+
+            if output:
+                self.writer.write(output)
+            await self.writer.drain()
+
+
+class Lz77StreamReader():
+    """
+    Wrapper around an asyncio.StreamReader that decompresses the data read
+    from it with an Lz77Decompressor.
+
+    The decoding is done in an executor, by default the event loop's thread
+    pool, and only as much compressed data is read as is needed for the
+    output asked for, so a peer sending faster than it is read from is held
+    back by the underlying reader.
+
+    Params:
+        reader: the asyncio.StreamReader to read the compressed data from
+        executor: concurrent.futures executor to decode in, or None for the
+                  default one
+        chunk_size: number of compressed bytes to read at a time
+        dictionary: the preset dictionary the stream was coded with, if any
+    """
+
+    def __init__(self, reader, executor=None, chunk_size=FLUSH_SIZE, dictionary=b''):
+        self.reader = reader
+        self.decompressor = Lz77Decompressor(dictionary)
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self.lock = asyncio.Lock()
+
+
+    def at_eof(self):
+        """ Check whether all of the decompressed data has been read """
+        decompressor = self.decompressor
+        return decompressor.eof and decompressor.returned == len(decompressor.message)
+
+
+    async def read(self, n=-1):
+        """
+        Read up to n bytes of decompressed data, or until the end of the
+        stream if n is negative.
+
+        Returns:
+            The data read, which is empty only at the end of the stream.
+
+        Raises:
+            ValueError: if the underlying stream ends before the compressed
+                        stream does
+        """
+
+        if n == 0:
+            return b''
+
+        if n < 0:
+            parts = []
+            while True:
+                part = await self.read(self.chunk_size)
+                if not part:
+                    return b''.join(parts)
+                parts.append(part)
+
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            decompressor = self.decompressor
+
+            while True:
+                if decompressor.needs_input:
+                    data = await self.reader.read(self.chunk_size)
+
+                    if not data and not decompressor.eof:
+                        raise ValueError('Compressed stream is truncated')
+                else:
+                    data = b''
+
+                output = await loop.run_in_executor(self.executor,
+                                                    decompressor.decompress, data, n)
+
+                if output or decompressor.eof:
+                    return output
+
+
+    async def readexactly(self, n):
+        """
+        Read exactly n bytes of decompressed data.
+
+        Raises:
+            asyncio.IncompleteReadError: if the stream ends first
+        """
+
+        parts = []
+        left = n
+
+        while left:
+            part = await self.read(left)
+            if not part:
+                raise asyncio.IncompleteReadError(b''.join(parts), n)
+            parts.append(part)
+            left -= len(part)
+
+        return b''.join(parts)
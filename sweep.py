@@ -0,0 +1,167 @@
+""" Digital Communication - Lempel-Ziv parameter sweeps """
+
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from benchmark import WARMUP_ROUNDS, benchmark_codec
+from decoder import Lz77Decoder
+from encoder import Lz77Encoder
+from match_finder import MatchIndex
+
+
+# Input files read by the current worker process, so that every grid point
+# after the first one coded in it finds the file in memory
+_inputs = {}
+
+
+def run_sweep(task, points, workers=None, checkpoint=None):
+    """
+    Run a task for every point of a parameter grid on a pool of worker
+    processes, and collect the results in grid order.
+
+    If a checkpoint file is given, every result is saved to it as soon as it
+    is known, and the results already in it are not computed again, so an
+    interrupted sweep carries on where it stopped when run again.
+
+    Params:
+        task: module-level function taking a point and returning a result
+              that can be saved as JSON
+        points: list of the grid points, each a tuple of JSON values
+        workers: number of worker processes, or None for one per CPU
+        checkpoint: name of the JSON file to keep the results in, or None
+
+    Returns:
+        List of the result of each point, in the order of the points.
+    """
+
+    results = _load_checkpoint(checkpoint)
+    todo = [point for point in points if _point_key(point) not in results]
+
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(workers)
+        try:
+            # Keep a few points per worker queued, so that an interrupted
+            # sweep does not wait for the whole grid to be cancelled
+            queued = {}
+            todo = iter(todo)
+            limit = 2 * workers
+
+            while True:
+                for point in todo:
+                    queued[pool.submit(task, point)] = point
+                    if len(queued) >= limit:
+                        break
+
+                if not queued:
+                    break
+
+                done, _ = wait(queued, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    results[_point_key(queued.pop(future))] = future.result()
+
+                _save_checkpoint(checkpoint, results)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    return [results[_point_key(point)] for point in points]
+
+
+def ratio_task(point):
+    """
+    Compression ratio of a file at one grid point, for run_sweep.
+
+    Params:
+        point: a tuple (filename, window size, buffer size, encoder options)
+
+    Returns:
+        The original size divided by the compressed size.
+    """
+
+    filename, window_size, buffer_size, options = point
+    data = _read_input(filename)
+
+    compressed = Lz77Encoder(window_size, buffer_size, **options).compress_bytes(data)
+    return len(data) / len(compressed)
+
+
+def time_task(point):
+    """
+    Running times of coding a file in memory at one grid point, for
+    run_sweep; see benchmark.benchmark_codec. Points run at the same time
+    share the CPUs, so fewer workers than CPUs give steadier timings.
+
+    Params:
+        point: a tuple (filename, window size, buffer size, rounds)
+
+    Returns:
+        A pair of summaries of the encoding and decoding times; see
+        benchmark.Timings.summary.
+    """
+
+    filename, window_size, buffer_size, rounds = point
+    data = _read_input(filename)
+
+    encoder = Lz77Encoder(window_size, buffer_size)
+    decoder = Lz77Decoder(window_size, buffer_size)
+
+    encoding, decoding, _ = benchmark_codec(encoder.compress_bytes, decoder.decompress_bytes,
+                                            data, rounds, min(rounds, WARMUP_ROUNDS))
+    return encoding.summary(), decoding.summary()
+
+
+def indexed_ratios(filename, window_sizes, buffer_sizes):
+    """
+    Compression ratios of a file over a grid of window and buffer sizes,
+    with the default encoder options, worked out from a single MatchIndex
+    of the file rather than compressing it at every grid point. Building
+    the index costs about as much as a couple of compressions with the
+    largest window, after which each point takes a small fraction of one.
+
+    Returns:
+        List holding a row of ratios for each window size, one for each
+        buffer size.
+    """
+
+    data = _read_input(filename)
+    index = MatchIndex(data, max(window_sizes), max(max(buffer_sizes) - 1, 1))
+
+    return [[len(data) / Lz77Encoder(w_size, b_size).compressed_size(data, index)
+             for b_size in buffer_sizes]
+            for w_size in window_sizes]
+
+
+def _read_input(filename):
+    if filename not in _inputs:
+        with open(filename, 'rb') as input_file:
+            _inputs[filename] = input_file.read()
+
+    return _inputs[filename]
+
+
+def _point_key(point):
+    return json.dumps(point, sort_keys=True)
+
+
+def _load_checkpoint(checkpoint):
+    if checkpoint is None or not os.path.exists(checkpoint):
+        return {}
+
+    with open(checkpoint) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def _save_checkpoint(checkpoint, results):
+    if checkpoint is None:
+        return
+
+    # Write a new file and rename it over the old one, so that an interrupt
+    # never leaves a half written checkpoint
+    partial = checkpoint + '.tmp'
+
+    with open(partial, 'w') as checkpoint_file:
+        json.dump(results, checkpoint_file)
+
+    os.replace(partial, checkpoint)
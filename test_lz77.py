@@ -0,0 +1,179 @@
+""" Digital Communication - Lempel-Ziv round trip tests
+
+Usage: python -m unittest test_lz77
+"""
+
+import io
+import os
+import random
+import tempfile
+import unittest
+
+from decoder import Lz77Decoder, Lz77Decompressor, decompress_bytes
+from encoder import CODE_FORMATS, Lz77Compressor, Lz77Encoder
+
+
+class CompressorRoundTripTest(unittest.TestCase):
+    """ Round trips through Lz77Compressor and both ways of decompressing """
+
+    def round_trip(self, data, *args, **options):
+        compressor = Lz77Compressor(*args, **options)
+        self.check(compressor.compress(data) + compressor.flush(), data)
+
+
+    def check(self, compressed, data):
+        self.assertEqual(decompress_bytes(compressed), data)
+        self.assertEqual(Lz77Decompressor().decompress(compressed), data)
+
+
+    def test_frame_as_large_as_its_block(self):
+        # Frames longer than the window whose bitstream is as large as their
+        # input, which must not be read as stored frames
+        rng = random.Random(0)
+
+        for _ in range(50):
+            data = bytes(rng.choice(b'abc') for _ in range(152))
+            self.round_trip(data, 8, 4, frame_size=13)
+
+
+    def test_last_code_without_symbol(self):
+        # Frames ending with a match and a byte of padding after it, which
+        # must not be read as the match's symbol
+        rng = random.Random(1157)
+
+        for _ in range(50):
+            data = bytes(rng.choice(b'abc') for _ in range(rng.randrange(100, 400)))
+            self.round_trip(data, 4, 4, frame_size=23)
+
+
+    def test_binary_tree_partial_flushes(self):
+        # A partial flush codes up to the end of the data given so far, whose
+        # last positions can only be placed in the binary trees once the
+        # data after them is there
+        rng = random.Random(456)
+
+        for code_format in CODE_FORMATS:
+            for parser in ('greedy', 'lazy'):
+                for _ in range(5):
+                    data = b''.join(bytes([rng.choice(b'ab')]) * rng.randrange(1, 30)
+                                    for _ in range(200))[:1000]
+                    compressor = Lz77Compressor(1000, 60, frame_size=100,
+                                                match_finder='binary_tree',
+                                                code_format=code_format, parser=parser)
+
+                    compressed = compressor.compress(data[:184]) + compressor.compress(data[184:456])
+                    compressed += compressor.flush(False)
+                    compressed += compressor.compress(data[456:700]) + compressor.flush(False)
+                    compressed += compressor.compress(data[700:]) + compressor.flush()
+
+                    self.check(compressed, data)
+
+
+def encode_at_pos(window, buffer):
+    """
+    Reference LZ77 coding at one position, searching the window directly
+    for the longest match of the lookahead buffer, leaving a symbol after it.
+
+    Returns:
+        A triple (distance, length, next_sym) with the closest of the
+        longest matches.
+    """
+
+    length = 0
+    substring = b''
+    next_sym = buffer[:1]
+
+    while substring + next_sym in window:
+        substring += next_sym
+        length += 1
+        next_sym = buffer[length:length + 1]
+        if length == len(buffer) - 1 or len(buffer) <= 1:
+            break
+
+    if length > 0:
+        distance = window[::-1].index(substring[::-1]) + length
+    else:
+        distance = 0
+
+    return (distance, length, next_sym)
+
+
+class EncoderTest(unittest.TestCase):
+    """ Codes of Lz77Encoder.encode against a reference """
+
+    def test_hash_chain_matches_reference(self):
+        rng = random.Random(1)
+
+        for window_size, buffer_size in ((4, 3), (16, 4), (64, 8), (255, 15)):
+            data = bytes(rng.choice(b'abc') for _ in range(500))
+            codes = list(Lz77Encoder(window_size, buffer_size).encode(data))
+
+            pos = 0
+            expected = []
+            while pos < len(data):
+                code = encode_at_pos(data[max(pos - window_size, 0):pos],
+                                     data[pos:pos + buffer_size])
+                expected.append(code)
+                pos += code[1] + 1
+
+            self.assertEqual(codes, expected)
+
+
+class UnseekableFile(io.BytesIO):
+    """ File written to like a pipe, which cannot be seeked """
+
+    def seekable(self):
+        return False
+
+
+    def seek(self, *args):
+        raise OSError('Illegal seek')
+
+
+class CompressStreamTest(unittest.TestCase):
+    """ Where Lz77Encoder.compress_stream writes, and the stored fallback """
+
+    def test_unseekable_output(self):
+        for data in (b'abc' * 100, os.urandom(500)):
+            output = UnseekableFile()
+            Lz77Encoder(255, 15).compress_stream(data, output)
+            self.assertEqual(decompress_bytes(output.getvalue()), data)
+
+
+    def test_output_after_other_data(self):
+        for data in (b'abc' * 100, os.urandom(500)):
+            for source in (data, io.BytesIO(data)):
+                output = io.BytesIO()
+                output.write(b'PREFIX')
+                Lz77Encoder(255, 15).compress_stream(source, output)
+
+                self.assertEqual(output.getvalue()[:6], b'PREFIX')
+                self.assertEqual(decompress_bytes(output.getvalue()[6:]), data)
+
+
+class ReadRangeTest(unittest.TestCase):
+    """ Lz77Decoder.read_range on a file with a block index """
+
+    def setUp(self):
+        self.data = bytes(random.Random(2).choice(b'abcd') for _ in range(3000))
+        output = tempfile.NamedTemporaryFile(suffix='.lz77', delete=False)
+        self.addCleanup(os.remove, output.name)
+        with output:
+            Lz77Encoder(255, 15, workers=1, block_size=1000, index=True).compress_stream(self.data, output)
+        self.filename = output.name
+
+
+    def test_ranges(self):
+        for start, length in ((0, 10), (995, 10), (1000, 2000), (2990, 100), (5000, 10), (7, 0)):
+            self.assertEqual(Lz77Decoder().read_range(self.filename, start, length),
+                             self.data[start:start + length])
+
+
+    def test_negative_range(self):
+        for start, length in ((-5, 10), (5, -1)):
+            with self.assertRaises(ValueError):
+                Lz77Decoder().read_range(self.filename, start, length)
+
+
+if __name__ == '__main__':
+    unittest.main()